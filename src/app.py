@@ -1,5 +1,5 @@
-from flask import (Flask, abort, flash, jsonify, redirect, render_template,
-                   request, session, url_for)
+from flask import (Flask, Response, abort, flash, jsonify, redirect, render_template,
+                   request, session, stream_with_context, url_for)
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import (Boolean, Column, Date, DateTime, Float, ForeignKey,
                         Integer, BigInteger, String)
@@ -11,14 +11,15 @@ import colorlog
 from datetime import datetime
 import pytz
 import sys
-import asyncio
+import queue
 from models import (User, Paper, PaperTag, ResultAbstTranslation,
-                    ResultAbstSummary, ResultPaperSummary)
-from skills import get_module_response
+                    ResultAbstSummary, ResultPaperSummary, Job)
+from jobs import enqueue
+from summarize import summarize_words, source_summaries, SUMMARY_MAX_PAPERS
 from set_log import setup_logger
 from dotenv import load_dotenv
-from lib import (get_paper_info, get_paper_abstract, get_paper_abstracts_from_words,
-                 translate_by_deepl)
+from lib import (get_paper_info, get_paper_abstract, translate_by_deepl, get_metrics)
+from lib.aio import run_sync, submit
 import json
 
 load_dotenv()
@@ -217,14 +218,21 @@ def create_app(db_uri="", test_config=None):
         request body:
         {
             "search_words": ["word1", "word2", ...],
-            "language": "English"
+            "language": "English",
+            "retmax": 5 (optional, number of papers to summarize)
         }
+        query: async=true to run it as a background job
 
         return:
         {
             "success": True,
             "result_abst_summary": formatted result_abst_summary
         }
+        or, with async=true, status 202 and
+        {
+            "success": True,
+            "job": formatted job (see GET /api/jobs/<id>)
+        }
         """
 
         # set error status
@@ -242,6 +250,9 @@ def create_app(db_uri="", test_config=None):
         if not "language" in keys:
             abort(400)
         language = body["language"]
+        retmax = body.get("retmax", 5)
+        if not isinstance(retmax, int) or not 0 < retmax <= SUMMARY_MAX_PAPERS:
+            abort(400)
 
         # retrieve user
         try:
@@ -251,27 +262,33 @@ def create_app(db_uri="", test_config=None):
         except Exception:
             error = True
             logger.warning(sys.exc_info())
+
+        # run it in a background job
+        if not error and request.args.get("async") == "true":
+            try:
+                job = enqueue("abst_summary", {
+                    "user_id": user_id,
+                    "search_words": search_words,
+                    "language": language,
+                    "retmax": retmax
+                })
+                formatted_job = job.format()
+            except Exception:
+                logger.warning(sys.exc_info())
+                abort(422)
+            return jsonify({
+                "success": True,
+                "job": formatted_job
+            }), 202
         
         # create new result abst summary
         if not error:
             try:
-                abstract_list = asyncio.run(get_paper_abstracts_from_words(
-                                                words=search_words
-                                            )
-                )
-                if abstract_list is None:
+                # summarize each abstract, then combine the summaries
+                result = run_sync(summarize_words(search_words, language, retmax))
+                if result is None:
                     abort(404)
-                # summarize each abstract
-                summarized_abstract_list = []
-                for i, abstract in enumerate(abstract_list):
-                    content_variables = {
-                        "language": "English",
-                        "abstract": abstract
-                    }
-                    json_response = get_module_response("abst_sum", content_variables)
-                    summarized_abstract = json.loads(json_response)["summary"]
-                    summarized_abstract_list.append(summarized_abstract)
-                    logger.info(f"Summarized abstract {i+1} of {len(abstract_list)}.")
+                summarized_abstract, summaries = result
 
             except Exception:
                 error = True
@@ -282,6 +299,8 @@ def create_app(db_uri="", test_config=None):
                     abst_summary=summarized_abstract,
                     language=language
                 )
+                # link the per-abstract summaries it was built from
+                result_abst_summary.paper_summaries = source_summaries(summaries)
                 result_abst_summary.user = user
                 result_abst_summary.insert()
                 formatted_result_abst_summary = result_abst_summary.format()
@@ -296,6 +315,102 @@ def create_app(db_uri="", test_config=None):
             "success": not error,
             "result_abst_summary": formatted_result_abst_summary
         })
+
+    @app.route('/api/users/<string:user_id>/results-abst-summary/stream', methods=('POST',))
+    def stream_user_result_abst_summary(user_id):
+        """Register a new result abst summary, streaming progress as NDJSON.
+        request body: same as POST /api/users/<user_id>/results-abst-summary
+
+        return: one JSON object per line, as work completes
+        {"event": "pmids", "pmids": [...]}
+        {"event": "abstract", "pmid": pmid, "available": True}
+        {"event": "summary", "pmid": pmid, "summary": summary}
+        {"event": "result_abst_summary", "success": True,
+         "result_abst_summary": formatted result_abst_summary}
+        or, when it failed,
+        {"event": "error", "success": False, "message": message}
+        """
+
+        # verify request body
+        body = request.get_json()
+
+        if body is None:
+            abort(400)
+        keys = body.keys()
+        if not "search_words" in keys:
+            abort(400)
+        search_words = body["search_words"]
+        if not "language" in keys:
+            abort(400)
+        language = body["language"]
+        retmax = body.get("retmax", 5)
+        if not isinstance(retmax, int) or not 0 < retmax <= SUMMARY_MAX_PAPERS:
+            abort(400)
+
+        # retrieve user
+        user = db.session.get(User, user_id)
+        if user is None:
+            abort(404)
+
+        # run the search and summaries on the event loop, events come back
+        # on a queue
+        events = queue.Queue()
+
+        async def run():
+            try:
+                with app.app_context():
+                    result = await summarize_words(
+                        search_words, language, retmax,
+                        on_event=lambda event, data: events.put((event, data))
+                    )
+                events.put(("done", result))
+            except Exception as e:
+                logger.warning(sys.exc_info())
+                events.put(("error", e))
+
+        def generate():
+            future = submit(run())
+            try:
+                yield from stream_events()
+            finally:
+                # the client went away
+                future.cancel()
+
+        def stream_events():
+            while True:
+                event, data = events.get()
+                if event == "error" or (event == "done" and data is None):
+                    message = "No papers found" if event == "done" else "Summarization failed"
+                    yield app.json.dumps({"event": "error", "success": False,
+                                      "message": message}) + "\n"
+                    return
+                if event != "done":
+                    yield app.json.dumps(dict(data, event=event)) + "\n"
+                    continue
+                summarized_abstract, summaries = data
+                try:
+                    result_abst_summary = ResultAbstSummary(
+                        abst_summary=summarized_abstract,
+                        language=language
+                    )
+                    result_abst_summary.paper_summaries = source_summaries(summaries)
+                    result_abst_summary.user = db.session.get(User, user_id)
+                    result_abst_summary.insert()
+                    formatted_result_abst_summary = result_abst_summary.format()
+                except Exception:
+                    logger.warning(sys.exc_info())
+                    db.session.rollback()
+                    yield app.json.dumps({"event": "error", "success": False,
+                                      "message": "Could not save the summary"}) + "\n"
+                    return
+                yield app.json.dumps({
+                    "event": "result_abst_summary",
+                    "success": True,
+                    "result_abst_summary": formatted_result_abst_summary
+                }) + "\n"
+                return
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
     
     @app.route('/api/users/<string:user_id>/results-abst-summary', methods=('GET',))
     def get_user_results_abst_summary(user_id):
@@ -377,11 +492,11 @@ def create_app(db_uri="", test_config=None):
         # create new paper
         try:
             # get paper info from Pubmed
-            paper_info = asyncio.run(get_paper_info(pmid))
+            paper_info = run_sync(get_paper_info(pmid))
             if paper_info is None:
                 abort(404)
             # get paper abstract
-            paper_abstract = asyncio.run(get_paper_abstract(pmid))
+            paper_abstract = run_sync(get_paper_abstract(pmid))
             if paper_abstract is None:
                 abort(404)
             paper = Paper(
@@ -544,12 +659,18 @@ def create_app(db_uri="", test_config=None):
         {
             "language": "Japanese"
         }
+        query: async=true to run it as a background job
 
         return:
         {
             "success": True,
             "result_abst_translation": formatted result_abst_translation
         }
+        or, with async=true, status 202 and
+        {
+            "success": True,
+            "job": formatted job (see GET /api/jobs/<id>)
+        }
         """
         # set error status
         error = False
@@ -572,6 +693,24 @@ def create_app(db_uri="", test_config=None):
         except Exception:
             error = True
             logger.warning(sys.exc_info())
+
+        # run it in a background job
+        if not error and request.args.get("async") == "true":
+            try:
+                job = enqueue("abst_translation", {
+                    "paper_id": id,
+                    "language": language
+                })
+                formatted_job = job.format()
+            except Exception:
+                logger.warning(sys.exc_info())
+                abort(422)
+            finally:
+                db.session.close()
+            return jsonify({
+                "success": True,
+                "job": formatted_job
+            }), 202
         
         # create new result abst translation
         try:
@@ -665,6 +804,61 @@ def create_app(db_uri="", test_config=None):
             "results_abst_summary_id": id
         })
 
+    @app.route('/api/jobs/<int:id>', methods=('GET',))
+    def get_job(id):
+        """Get status and result of a background job.
+        return:
+        {
+            "success": True,
+            "job": {
+                "id": id,
+                "job_type": "abst_summary" or "abst_translation",
+                "status": "queued", "running", "done" or "failed",
+                "attempts": attempts,
+                "result": persisted result when done, e.g.
+                          {"result_abst_summary": formatted result_abst_summary},
+                "error": last error,
+                ...
+            }
+        }
+        """
+        # set error status
+        error = False
+
+        # get job
+        try:
+            job = db.session.get(Job, id)
+            if job is None:
+                abort(404)
+            formatted_job = job.format()
+        except Exception:
+            error = True
+            logger.warning(sys.exc_info())
+        finally:
+            db.session.close()
+        
+        if error:
+            abort(422)
+        
+        return jsonify({
+            "success": not error,
+            "job": formatted_job
+        })
+
+    @app.route('/api/metrics', methods=('GET',))
+    def get_app_metrics():
+        """Get counters and gauges of this worker.
+        return:
+        {
+            "success": True,
+            "metrics": {"counters": {...}, "gauges": {...}}
+        }
+        """
+        return jsonify({
+            "success": True,
+            "metrics": get_metrics()
+        })
+
         
     
 
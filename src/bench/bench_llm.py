@@ -0,0 +1,196 @@
+"""Benchmark the LLM calls of skills.py against the local OpenAI stand-in.
+
+usage:
+    python -m bench.bench_llm --latency 1.0 --distribution lognormal --jitter 0.3
+    python -m bench.bench_llm --concurrency 1,4,16,64 --server-tpm 90000 --json > bench_output.txt
+
+abst_sum and abst_sum_final (--module) are driven through
+get_module_response at each concurrency level, so the token budgeting,
+the OpenAI limiter and the retries are part of the measurement; the LLM
+response cache is disabled. For every level it reports throughput,
+p50/p95/p99 latency, failures and retries, and it names the saturation
+point: the lowest concurrency reaching (1 - --tolerance) of the peak
+throughput.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from bench.bench_pubmed import percentile
+from bench.fake_openai import DISTRIBUTIONS, FakeOpenAIConfig, start_server
+
+MODULES = ("abst_sum", "abst_sum_final")
+ABSTRACT_SENTENCE = "Neutrophil chemotaxis plays a vital role in the human immune system. "
+
+
+def configure_environment(base_url, rpm, tpm):
+    # must run before skills is imported
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    os.environ["OPENAI_RPM"] = str(rpm)
+    os.environ["OPENAI_TPM"] = str(tpm)
+    os.environ["OPENAI_RATE_LIMIT_DIR"] = tempfile.mkdtemp(prefix="bench_llm_")
+
+
+def make_operations(skills, abstract_size, final_size):
+    # every call gets a different input, like distinct papers
+    numbers = itertools.count()
+    abstract = (ABSTRACT_SENTENCE * max(1, abstract_size // len(ABSTRACT_SENTENCE))).strip()
+    summary = " ".join(abstract.split()[:100])
+
+    async def abst_sum():
+        await skills.get_module_response("abst_sum", {
+            "language": "English",
+            "abstract": f"Study {next(numbers)}. {abstract}",
+        })
+
+    async def abst_sum_final():
+        number = next(numbers)
+        await skills.get_module_response("abst_sum_final", {
+            "language": "English",
+            "abstract_list": "\n\n".join(
+                f"Study {number}.{i}. {summary}" for i in range(final_size)
+            ),
+        })
+
+    return {"abst_sum": abst_sum, "abst_sum_final": abst_sum_final}
+
+
+async def run_level(operation, requests, concurrency):
+    latencies = []
+    failures = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed():
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await operation()
+            except Exception as e:
+                failures.append(repr(e))
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[timed() for _ in range(requests)])
+    return latencies, failures, time.perf_counter() - start
+
+
+def saturation_point(results, tolerance):
+    """Return the first result reaching (1 - tolerance) of the peak throughput."""
+    if not results:
+        return None
+    peak = max(r["throughput_ops"] for r in results)
+    for r in results:
+        if r["throughput_ops"] >= (1 - tolerance) * peak:
+            return r
+    return None
+
+
+async def run_benchmark(skills, get_metrics, modules, levels, requests,
+                        abstract_size, final_size):
+    operations = make_operations(skills, abstract_size, final_size)
+    results = []
+    for name in modules:
+        operation = operations[name]
+        # creates the kernel and the model, and warms up the connections
+        await operation()
+        for concurrency in levels:
+            counters = dict(get_metrics()["counters"])
+            latencies, failures, elapsed = await run_level(operation, requests, concurrency)
+            after = get_metrics()["counters"]
+            results.append({
+                "module": name,
+                "concurrency": concurrency,
+                "requests": requests,
+                "throughput_ops": len(latencies) / elapsed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "failures": len(failures),
+                "retries": after.get("openai.retried", 0) - counters.get("openai.retried", 0),
+                "queued": after.get("openai.queued", 0) - counters.get("openai.queued", 0),
+                "first_failure": failures[0] if failures else None,
+            })
+    return results
+
+
+def print_table(results, tolerance):
+    header = (f"{'module':<15} {'conc':>5} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'failed':>7} {'retries':>8} {'queued':>7}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['module']:<15} {r['concurrency']:>5} {r['throughput_ops']:>8.2f} "
+              f"{r['p50_ms']:>8.0f} {r['p95_ms']:>8.0f} {r['p99_ms']:>8.0f} "
+              f"{r['failures']:>7} {r['retries']:>8} {r['queued']:>7}")
+    for name in dict.fromkeys(r["module"] for r in results):
+        point = saturation_point([r for r in results if r["module"] == name], tolerance)
+        print(f"{name}: saturates at concurrency {point['concurrency']} "
+              f"({point['throughput_ops']:.2f} ops/s, p95 {point['p95_ms']:.0f} ms)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", choices=MODULES, action="append",
+                        help="module to run (default: all)")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32,64",
+                        help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="calls per level")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="share of the peak throughput below saturation")
+    parser.add_argument("--abstract-size", type=int, default=1500)
+    parser.add_argument("--final-size", type=int, default=10,
+                        help="summaries per abst_sum_final call")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--server-rpm", type=int, default=0, help="stand-in rpm limit")
+    parser.add_argument("--server-tpm", type=int, default=0, help="stand-in tpm limit")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--rpm", type=float, default=1000000,
+                        help="client side requests/min (OPENAI_RPM)")
+    parser.add_argument("--tpm", type=float, default=1000000000,
+                        help="client side tokens/min (OPENAI_TPM)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+    levels = [int(level) for level in args.concurrency.split(",") if level]
+
+    config = FakeOpenAIConfig(
+        latency=args.latency, jitter=args.jitter, distribution=args.distribution,
+        tokens_per_second=args.tokens_per_second, rpm=args.server_rpm, tpm=args.server_tpm,
+        rate_429=args.rate_429, rate_500=args.rate_500, retry_after=0,
+    )
+    server, base_url = start_server(config)
+    configure_environment(base_url, args.rpm, args.tpm)
+    import skills
+    from lib.metrics import get_metrics
+
+    results = asyncio.run(run_benchmark(
+        skills, get_metrics, args.module or MODULES, levels, args.requests,
+        args.abstract_size, args.final_size,
+    ))
+    server.shutdown()
+
+    if args.json:
+        saturation = {
+            name: saturation_point([r for r in results if r["module"] == name], args.tolerance)
+            for name in dict.fromkeys(r["module"] for r in results)
+        }
+        print(json.dumps({"results": results, "saturation": saturation,
+                          "server": server.RequestHandlerClass.stats}, indent=2))
+    else:
+        print_table(results, args.tolerance)
+        print(f"server: {server.RequestHandlerClass.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Benchmark lib/pubmed.py against the local E-utilities stand-in.
+
+usage:
+    python -m bench.bench_pubmed --latency 0.1 --jitter 0.05 --concurrency 8
+    python -m bench.bench_pubmed --scenario bulk --json > bench_output.txt
+
+For every scenario it reports throughput, p50/p95/p99 latency and the
+memory allocated per operation (tracemalloc, measured in a separate pass
+so it does not distort the timings). The record and search caches are
+bypassed so every operation reaches the server.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from bench.fake_eutils import FakeEutilsConfig, start_server
+
+SCENARIOS = ("single", "search", "bulk")
+
+
+def percentile(values, q):
+    """Return the q-th percentile (0-100) of values (nearest rank)."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def configure_environment(base_url, rate_limit):
+    # must run before lib.pubmed is imported
+    os.environ["EUTILS_BASE_URL"] = base_url
+    os.environ["NCBI_RATE_LIMIT"] = str(rate_limit)
+    os.environ["NCBI_RATE_LIMIT_FILE"] = os.path.join(
+        tempfile.mkdtemp(prefix="bench_pubmed_"), "rate_limit.json"
+    )
+
+
+def make_operations(pubmed, bulk_size):
+    # each operation uses new PMIDs so nothing is served from a cache
+    pmids = itertools.count(40000000)
+
+    async def single():
+        pmid = next(pmids)
+        await pubmed.get_paper_info(pmid)
+        await pubmed.get_paper_abstract(pmid)
+
+    async def search():
+        await pubmed.get_paper_abstracts_from_words(
+            [f"word{next(pmids)}"], retmax=5, use_cache=False
+        )
+
+    async def bulk():
+        batch = [next(pmids) for _ in range(bulk_size)]
+        await pubmed.get_paper_infos(batch)
+        await pubmed.get_paper_abstracts(batch)
+
+    return {"single": single, "search": search, "bulk": bulk}
+
+
+async def run_scenario(operation, requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed():
+        async with semaphore:
+            start = time.perf_counter()
+            await operation()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[timed() for _ in range(requests)])
+    return latencies, time.perf_counter() - start
+
+
+async def measure_allocations(operation, requests):
+    # allocations per operation (run sequentially under tracemalloc)
+    await operation()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(requests):
+        await operation()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    allocated = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    return allocated / requests, blocks / requests, peak
+
+
+async def run_benchmark(pubmed, scenarios, requests, concurrency, bulk_size, alloc_requests):
+    from lib.http_client import close_client
+
+    operations = make_operations(pubmed, bulk_size)
+    results = []
+    try:
+        for name in scenarios:
+            operation = operations[name]
+            # warm up the connection pool
+            await operation()
+            latencies, elapsed = await run_scenario(operation, requests, concurrency)
+            allocated, blocks, peak = await measure_allocations(operation, alloc_requests)
+            results.append({
+                "scenario": name,
+                "requests": requests,
+                "concurrency": concurrency,
+                "throughput_ops": requests / elapsed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p95_ms": percentile(latencies, 95) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "alloc_kib_per_op": allocated / 1024,
+                "alloc_blocks_per_op": blocks,
+                "peak_kib": peak / 1024,
+            })
+            pubmed.record_cache.memory.clear()
+            pubmed.search_cache.clear()
+    finally:
+        # the loop of asyncio.run ends with this coroutine
+        await close_client()
+    return results
+
+
+def print_table(results):
+    header = (f"{'scenario':<8} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'KiB/op':>9} {'blocks/op':>10} {'peak KiB':>9}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<8} {r['throughput_ops']:>8.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['alloc_kib_per_op']:>9.1f} "
+              f"{r['alloc_blocks_per_op']:>10.0f} {r['peak_kib']:>9.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append",
+                        help="scenario to run (default: all)")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--bulk-size", type=int, default=500)
+    parser.add_argument("--alloc-requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--abstract-size", type=int, default=1500)
+    parser.add_argument("--rate-limit", type=float, default=1000,
+                        help="client side requests/s (NCBI_RATE_LIMIT)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    config = FakeEutilsConfig(latency=args.latency, jitter=args.jitter,
+                              rate_429=args.rate_429, retry_after=0,
+                              abstract_size=args.abstract_size)
+    server, base_url = start_server(config)
+    configure_environment(base_url, args.rate_limit)
+    from lib import pubmed
+    from lib.metrics import get_metrics
+
+    results = asyncio.run(run_benchmark(
+        pubmed, args.scenario or SCENARIOS, args.requests, args.concurrency,
+        args.bulk_size, args.alloc_requests,
+    ))
+    server.shutdown()
+
+    if args.json:
+        print(json.dumps({"results": results, "server": server.RequestHandlerClass.stats,
+                          "client": get_metrics()["counters"]}, indent=2))
+    else:
+        print_table(results)
+        print(f"server: {server.RequestHandlerClass.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Measure the cold start of the application (import of app:app).
+
+usage:
+    python -m bench.bench_startup                    # profile + timings
+    python -m bench.bench_startup --runs 10 --budget 1.5
+    python -m bench.bench_startup --module models --json
+
+The profile runs `python -X importtime -c "import app"` in a fresh
+interpreter and lists the modules with the largest cumulative import
+time. The timings import the module in --runs fresh interpreters, and
+the script exits with status 1 when the median is over the budget
+(--budget or STARTUP_BUDGET, seconds), so it can gate CI.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", "2.0"))
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile(module):
+    """Return [{"module", "self", "cumulative", "depth"}] of one import (seconds)."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+    profile = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            profile.append({
+                "module": match.group(4),
+                "self": int(match.group(1)) / 1e6,
+                "cumulative": int(match.group(2)) / 1e6,
+                "depth": len(match.group(3)) // 2,
+            })
+    return profile
+
+
+def time_import(module):
+    # wall time of a fresh interpreter importing module, minus a bare interpreter
+    def run(code):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - started
+    return run(f"import {module}") - run("pass")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app", help="module to import (default: app)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20, help="modules listed in the profile")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET,
+                        help="max median import time in seconds (STARTUP_BUDGET)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    profile = import_profile(args.module)
+    top = sorted(profile, key=lambda entry: entry["cumulative"], reverse=True)[:args.top]
+    timings = [time_import(args.module) for _ in range(args.runs)]
+    median = statistics.median(timings)
+    result = {
+        "module": args.module,
+        "runs": args.runs,
+        "median": round(median, 3),
+        "min": round(min(timings), 3),
+        "max": round(max(timings), 3),
+        "budget": args.budget,
+        "within_budget": median <= args.budget,
+        "top": top,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{'module':<50} {'self s':>8} {'cumul s':>8}")
+        for entry in top:
+            name = "  " * entry["depth"] + entry["module"]
+            print(f"{name:<50} {entry['self']:>8.3f} {entry['cumulative']:>8.3f}")
+        print(f"\nimport {args.module}: median {median:.3f}s "
+              f"(min {min(timings):.3f}s, max {max(timings):.3f}s, {args.runs} runs), "
+              f"budget {args.budget:.3f}s")
+    if median > args.budget:
+        print(f"import {args.module} is over budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Local stand-in for the NCBI E-utilities (esearch/esummary/efetch).
+
+usage:
+    python -m bench.fake_eutils --port 8765 --latency 0.2 --jitter 0.05 --rate-429 0.02
+    EUTILS_BASE_URL=http://127.0.0.1:8765/entrez/eutils gunicorn app:app
+
+Responses are built from the fixtures in bench/fixtures (or --fixtures):
+esearch.json, esummary_document.json and efetch_article.xml, where
+__PMID__/__ABSTRACT__/... are replaced for every requested PMID.
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+XML_HEADER = (
+    '<?xml version="1.0" ?>\n'
+    '<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2024//EN" '
+    '"https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_240101.dtd">\n'
+)
+ABSTRACT_SENTENCE = "Neutrophil chemotaxis plays a vital role in the human immune system. "
+
+
+class FakeEutilsConfig:
+    """Behaviour of the stand-in server.
+
+    Arguments:
+        latency (float): seconds added to every response
+        jitter (float): random extra seconds (uniform 0..jitter)
+        rate_429 (float): probability of answering 429 Too Many Requests
+        retry_after (float): Retry-After sent with 429 responses
+        abstract_size (int): approximate characters per abstract
+        count (int): number of results reported by esearch
+        fixtures_dir (string): directory of the response fixtures
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_429=0.0, retry_after=1.0,
+                 abstract_size=1500, count=10000, fixtures_dir=FIXTURES_DIR):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.abstract_size = abstract_size
+        self.count = count
+        with open(os.path.join(fixtures_dir, "esearch.json")) as f:
+            self.esearch = f.read()
+        with open(os.path.join(fixtures_dir, "esummary_document.json")) as f:
+            self.esummary_document = f.read()
+        with open(os.path.join(fixtures_dir, "efetch_article.xml")) as f:
+            self.efetch_article = f.read()
+        repeat = max(1, abstract_size // len(ABSTRACT_SENTENCE))
+        self.abstract = (ABSTRACT_SENTENCE * repeat).strip()
+
+
+class FakeEutilsHandler(BaseHTTPRequestHandler):
+    # keep-alive, like the real service
+    protocol_version = "HTTP/1.1"
+    config = FakeEutilsConfig()
+    # request counters, read by the benchmark
+    stats = {"requests": 0, "throttled": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self._handle(parse_qs(self.rfile.read(length).decode()))
+
+    def _handle(self, query):
+        params = {key: values[0] for key, values in query.items()}
+        config = self.config
+        with self.stats_lock:
+            self.stats["requests"] += 1
+        time.sleep(config.latency + random.uniform(0, config.jitter))
+
+        if random.random() < config.rate_429:
+            with self.stats_lock:
+                self.stats["throttled"] += 1
+            self._send(429, "application/json",
+                       '{"error":"API rate limit exceeded"}',
+                       {"Retry-After": str(config.retry_after)})
+            return
+
+        endpoint = urlparse(self.path).path.rsplit("/", 1)[-1]
+        if endpoint == "esearch.fcgi":
+            self._send(200, "application/json", self._esearch(params))
+        elif endpoint == "esummary.fcgi":
+            self._send(200, "application/json", self._esummary(params))
+        elif endpoint == "efetch.fcgi":
+            if params.get("rettype") == "uilist":
+                self._send(200, "text/plain", "\n".join(self._ids(params)) + "\n")
+            else:
+                self._send(200, "text/xml", self._efetch(params))
+        else:
+            self._send(404, "text/plain", "Not Found")
+
+    def _send(self, status, content_type, body, headers=None):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _ids(self, params):
+        # explicit id list, or a page of the (fake) history server set
+        if "id" in params:
+            return [pmid for pmid in params["id"].split(",") if pmid]
+        retstart = int(params.get("retstart", 0))
+        retmax = int(params.get("retmax", 20))
+        last = min(self.config.count, retstart + retmax)
+        return [str(30000000 + i) for i in range(retstart, last)]
+
+    def _esearch(self, params):
+        retstart = int(params.get("retstart", 0))
+        retmax = int(params.get("retmax", 20))
+        response = json.loads(
+            self.config.esearch
+            .replace("__COUNT__", str(self.config.count))
+            .replace("__RETMAX__", str(retmax))
+            .replace("__RETSTART__", str(retstart))
+            .replace("__TERM__", params.get("term", ""))
+        )
+        result = response["esearchresult"]
+        result["idlist"] = self._ids({"retstart": retstart, "retmax": retmax})
+        if params.get("usehistory") == "y":
+            result["webenv"] = "FAKE_WEBENV"
+            result["querykey"] = "1"
+        return json.dumps(response)
+
+    def _esummary(self, params):
+        ids = self._ids(params)
+        result = {"uids": ids}
+        for pmid in ids:
+            result[pmid] = json.loads(self.config.esummary_document.replace("__PMID__", pmid))
+        return json.dumps({"header": {"type": "esummary", "version": "0.3"},
+                           "result": result})
+
+    def _efetch(self, params):
+        articles = [
+            self.config.efetch_article
+            .replace("__PMID__", pmid)
+            .replace("__ABSTRACT__", self.config.abstract)
+            for pmid in self._ids(params)
+        ]
+        return XML_HEADER + "<PubmedArticleSet>\n" + "".join(articles) + "</PubmedArticleSet>\n"
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Start the stand-in server in a daemon thread.
+
+    Returns:
+        tuple: (server, base url to use as EUTILS_BASE_URL)
+    """
+    handler = type("ConfiguredFakeEutilsHandler", (FakeEutilsHandler,), {
+        "config": config or FakeEutilsConfig(),
+        "stats": {"requests": 0, "throttled": 0},
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/entrez/eutils"
+    return server, base_url
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--abstract-size", type=int, default=1500)
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    args = parser.parse_args(argv)
+
+    config = FakeEutilsConfig(
+        latency=args.latency, jitter=args.jitter, rate_429=args.rate_429,
+        retry_after=args.retry_after, abstract_size=args.abstract_size,
+        count=args.count, fixtures_dir=args.fixtures,
+    )
+    server, base_url = start_server(config, args.host, args.port)
+    print(f"Serving fake E-utilities at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+usage:
+    python -m bench.fake_openai --port 8766 --latency 1.0 --distribution lognormal --tpm 90000
+    OPENAI_BASE_URL=http://127.0.0.1:8766/v1 OPENAI_API_KEY=fake gunicorn app:app
+
+POST /v1/chat/completions answers with a deterministic JSON message:
+{"summary": ...} for abst_sum/abst_sum_final prompts, or
+{"summaries": [{"pmid", "summary"}]} for abst_sum_batch prompts (one
+per "PMID: <pmid>" line). The same messages always give the same answer.
+
+Latency is drawn from --distribution (constant, uniform or lognormal)
+plus completion tokens / --tokens-per-second. Requests over --rpm/--tpm
+in the last minute get 429 with OpenAI's x-ratelimit-* headers, and
+--rate-429/--rate-500 inject errors at random.
+"""
+import argparse
+from collections import deque
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import random
+import re
+import threading
+import time
+
+DISTRIBUTIONS = ("constant", "uniform", "lognormal")
+SUMMARY_SENTENCE = "The study describes its methods, main results and their implications. "
+
+_PMID = re.compile(r"^PMID: (\d+)\s*$", re.MULTILINE)
+
+
+def estimate_tokens(text):
+    # about 4 characters per token, like lib/tokens.py without tiktoken
+    return len(text) // 4 + 1
+
+
+class FakeOpenAIConfig:
+    """Behaviour of the stand-in server.
+
+    Arguments:
+        latency (float): base seconds of every response (median for lognormal)
+        jitter (float): spread of the distribution (uniform: extra 0..jitter
+            seconds, lognormal: sigma)
+        distribution (string): one of DISTRIBUTIONS
+        tokens_per_second (float): completion tokens generated per second
+            (0 for no generation time)
+        rpm (int): requests per minute before 429 (0 for no limit)
+        tpm (int): prompt + max_tokens per minute before 429 (0 for no limit)
+        rate_429 (float): probability of a random 429
+        rate_500 (float): probability of a 500
+        retry_after (float): retry-after sent with random 429 responses
+        summary_words (int): approximate words per summary
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, distribution="uniform",
+                 tokens_per_second=0.0, rpm=0, tpm=0, rate_429=0.0, rate_500=0.0,
+                 retry_after=1.0, summary_words=100):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f'Invalid distribution: {distribution}')
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.tokens_per_second = tokens_per_second
+        self.rpm = rpm
+        self.tpm = tpm
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.retry_after = retry_after
+        repeat = max(1, summary_words * 6 // len(SUMMARY_SENTENCE))
+        self.summary = (SUMMARY_SENTENCE * repeat).strip()
+
+    def sample_latency(self):
+        if self.distribution == "constant":
+            return self.latency
+        if self.distribution == "lognormal":
+            if self.latency <= 0:
+                return 0.0
+            return random.lognormvariate(math.log(self.latency), self.jitter)
+        return self.latency + random.uniform(0, self.jitter)
+
+
+class MinuteWindow:
+    """Requests and tokens of the last minute, for the rpm/tpm limits."""
+
+    def __init__(self):
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def try_add(self, tokens, rpm, tpm):
+        """Count a call if it fits the limits.
+
+        Returns:
+            dict: x-ratelimit-* headers; "allowed" tells whether it fit
+        """
+        with self._lock:
+            now = time.time()
+            while self._calls and now - self._calls[0][0] >= 60:
+                self._calls.popleft()
+            used_requests = len(self._calls)
+            used_tokens = sum(call_tokens for _, call_tokens in self._calls)
+            allowed = (not rpm or used_requests + 1 <= rpm) \
+                and (not tpm or used_tokens + tokens <= tpm)
+            if allowed:
+                self._calls.append((now, tokens))
+                used_requests += 1
+                used_tokens += tokens
+            # seconds until the oldest call leaves the window
+            reset = 60 - (now - self._calls[0][0]) if self._calls else 0.0
+        headers = {"allowed": allowed}
+        if rpm:
+            headers.update({
+                "x-ratelimit-limit-requests": str(rpm),
+                "x-ratelimit-remaining-requests": str(max(0, rpm - used_requests)),
+                "x-ratelimit-reset-requests": f"{reset:.3f}s",
+            })
+        if tpm:
+            headers.update({
+                "x-ratelimit-limit-tokens": str(tpm),
+                "x-ratelimit-remaining-tokens": str(max(0, tpm - used_tokens)),
+                "x-ratelimit-reset-tokens": f"{reset:.3f}s",
+            })
+        return headers
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog (5) makes concurrent connects wait for SYN retries
+    request_queue_size = 128
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    # keep-alive, like the real service
+    protocol_version = "HTTP/1.1"
+    config = FakeOpenAIConfig()
+    window = MinuteWindow()
+    # request counters, read by the benchmark
+    stats = {"requests": 0, "throttled": 0, "errors": 0, "completion_tokens": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": "Not Found", "type": "invalid_request_error"}})
+            return
+        self._count("requests")
+        config = self.config
+
+        prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+        prompt_tokens = estimate_tokens(prompt)
+        max_tokens = body.get("max_tokens") or 0
+        limits = self.window.try_add(prompt_tokens + max_tokens, config.rpm, config.tpm)
+        headers = {key: value for key, value in limits.items() if key != "allowed"}
+        if not limits["allowed"] or random.random() < config.rate_429:
+            self._count("throttled")
+            if limits["allowed"]:
+                headers["retry-after"] = str(config.retry_after)
+            self._send(429, {"error": {"message": "Rate limit reached",
+                                       "type": "requests", "code": "rate_limit_exceeded"}},
+                       headers)
+            return
+        if random.random() < config.rate_500:
+            self._count("errors")
+            time.sleep(config.sample_latency())
+            self._send(500, {"error": {"message": "The server had an error",
+                                       "type": "server_error"}}, headers)
+            return
+
+        content = self._content(prompt)
+        completion_tokens = estimate_tokens(content)
+        self._count("completion_tokens", completion_tokens)
+        generation = completion_tokens / config.tokens_per_second \
+            if config.tokens_per_second else 0.0
+        time.sleep(config.sample_latency() + generation)
+        digest = hashlib.sha256(prompt.encode()).hexdigest()
+        self._send(200, {
+            "id": f"chatcmpl-{digest[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }, headers)
+
+    def _content(self, prompt):
+        # deterministic answer: the summaries quote a hash of the input
+        def summary(text):
+            return f"[{hashlib.sha256(text.encode()).hexdigest()[:12]}] {self.config.summary}"
+
+        if '"summaries"' in prompt:
+            pmids = _PMID.findall(prompt)
+            return json.dumps({"summaries": [
+                {"pmid": pmid, "summary": summary(f"{pmid}\n{prompt}")} for pmid in pmids
+            ]}, ensure_ascii=False)
+        return json.dumps({"summary": summary(prompt)}, ensure_ascii=False)
+
+    def _count(self, key, value=1):
+        with self.stats_lock:
+            self.stats[key] += value
+
+    def _send(self, status, body, headers=None):
+        body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """Start the stand-in server in a daemon thread.
+
+    Returns:
+        tuple: (server, base url to use as OPENAI_BASE_URL)
+    """
+    handler = type("ConfiguredFakeOpenAIHandler", (FakeOpenAIHandler,), {
+        "config": config or FakeOpenAIConfig(),
+        "window": MinuteWindow(),
+        "stats": {"requests": 0, "throttled": 0, "errors": 0, "completion_tokens": 0},
+    })
+    server = FakeOpenAIServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/v1"
+    return server, base_url
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--rpm", type=int, default=0)
+    parser.add_argument("--tpm", type=int, default=0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-500", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--summary-words", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    config = FakeOpenAIConfig(
+        latency=args.latency, jitter=args.jitter, distribution=args.distribution,
+        tokens_per_second=args.tokens_per_second, rpm=args.rpm, tpm=args.tpm,
+        rate_429=args.rate_429, rate_500=args.rate_500, retry_after=args.retry_after,
+        summary_words=args.summary_words,
+    )
+    server, base_url = start_server(config, args.host, args.port)
+    print(f"Serving fake OpenAI API at {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Load PubMed baseline/update dumps into the pubmed_catalog table.
+
+usage:
+    python ingest_pubmed.py /data/pubmed/pubmed24n*.xml.gz --workers 4
+
+Files are parsed incrementally (lib/pubmed_xml.py) and loaded with COPY
+into a staging table, then merged into pubmed_catalog. Files are loaded
+in parallel, so every row keeps the number of the file it came from and
+a row is only replaced by a row from the same or a later file.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+import glob
+import gzip
+import io
+import re
+import sys
+import time
+import psycopg2
+from set_log import setup_logger
+from lib.pubmed_xml import iter_pubmed_articles
+
+logger = setup_logger(__name__)
+
+# rows sent in one COPY
+COPY_BATCH_SIZE = 50000
+
+CATALOG_COLUMNS = ("pmid", "title", "last_author", "publication_date",
+                   "abstract", "deleted", "file_number")
+
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE pubmed_catalog_staging (
+    position BIGINT,
+    pmid VARCHAR,
+    title VARCHAR,
+    last_author VARCHAR,
+    publication_date VARCHAR,
+    abstract VARCHAR,
+    deleted BOOLEAN,
+    file_number INTEGER
+) ON COMMIT DROP
+"""
+
+COPY_SQL = """
+COPY pubmed_catalog_staging (position, pmid, title, last_author,
+                             publication_date, abstract, deleted, file_number)
+FROM STDIN WITH (FORMAT csv)
+"""
+
+# the last row of a PMID in a file wins; rows from older files never
+# replace rows from newer ones
+MERGE_SQL = """
+INSERT INTO pubmed_catalog (pmid, title, last_author, publication_date,
+                            abstract, deleted, file_number, loaded_at)
+SELECT DISTINCT ON (pmid) pmid, title, last_author, publication_date,
+       abstract, deleted, file_number, now()
+FROM pubmed_catalog_staging
+ORDER BY pmid, position DESC
+ON CONFLICT (pmid) DO UPDATE SET
+    title = EXCLUDED.title,
+    last_author = EXCLUDED.last_author,
+    publication_date = EXCLUDED.publication_date,
+    abstract = EXCLUDED.abstract,
+    deleted = EXCLUDED.deleted,
+    file_number = EXCLUDED.file_number,
+    loaded_at = EXCLUDED.loaded_at
+WHERE pubmed_catalog.file_number <= EXCLUDED.file_number
+"""
+
+
+def get_file_number(path):
+    """Return the sequence number of a dump file (pubmed24n1234.xml.gz -> 1234)."""
+    match = re.search(r"n(\d+)\.xml(\.gz)?$", path)
+    if match is None:
+        raise ValueError(f"Not a PubMed dump file name: {path}")
+    return int(match.group(1))
+
+
+def open_dump(path):
+    # dumps are gzipped, but plain XML is accepted for samples
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_catalog_rows(path):
+    """Yield pubmed_catalog rows (tuples in CATALOG_COLUMNS order) of a dump file."""
+    file_number = get_file_number(path)
+    with open_dump(path) as f:
+        for record in iter_pubmed_articles(f, include_deleted=True):
+            if record.get("deleted"):
+                yield (record["pmid"], None, None, None, None, True, file_number)
+            else:
+                yield (record["pmid"], record["title"], record["last_author"],
+                       record["publication_date"], record["abstract"], False,
+                       file_number)
+
+
+def _copy_batch(connection, rows, first_position):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for position, row in enumerate(rows, start=first_position):
+        writer.writerow((position,) + row)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_STAGING_SQL)
+        cursor.copy_expert(COPY_SQL, buffer)
+        cursor.execute(MERGE_SQL)
+    connection.commit()
+
+
+def load_file(path, database_path, batch_size=COPY_BATCH_SIZE):
+    """Parse one dump file and load it into pubmed_catalog.
+
+    Returns:
+        tuple: (path, number of rows)
+    """
+    start_time = time.time()
+    count = 0
+    connection = psycopg2.connect(database_path)
+    try:
+        batch = []
+        for row in iter_catalog_rows(path):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                _copy_batch(connection, batch, count)
+                count += len(batch)
+                batch = []
+        if batch:
+            _copy_batch(connection, batch, count)
+            count += len(batch)
+    finally:
+        connection.close()
+    logger.info(f"Loaded {count} rows from {path} in {time.time() - start_time:.1f} sec")
+    return path, count
+
+
+def ingest(paths, database_path, workers=4, batch_size=COPY_BATCH_SIZE):
+    """Load dump files in parallel with a process pool.
+
+    Returns:
+        int: number of rows loaded
+    """
+    # oldest files first so most conflicts are resolved in order
+    paths = sorted(paths, key=get_file_number)
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(load_file, path, database_path, batch_size)
+                   for path in paths]
+        for future in as_completed(futures):
+            path, count = future.result()
+            total += count
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", help="dump files or glob patterns")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=COPY_BATCH_SIZE)
+    parser.add_argument("--database-url", default=None,
+                        help="defaults to the application database")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for pattern in args.files:
+        paths.extend(glob.glob(pattern) or [pattern])
+    database_path = args.database_url
+    if database_path is None:
+        from models import DATABASE_PATH
+        database_path = DATABASE_PATH
+
+    start_time = time.time()
+    total = ingest(paths, database_path, args.workers, args.batch_size)
+    logger.info(f"Loaded {total} rows from {len(paths)} files in "
+                f"{time.time() - start_time:.1f} sec")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,306 @@
+"""Postgres-backed background jobs.
+
+usage:
+    python jobs.py                          # every job type
+    python jobs.py --type abst_summary      # only abstract summaries
+
+Web workers enqueue jobs (POST ...?async=true answers 202 with the job),
+worker processes started by this script dequeue them with
+SELECT ... FOR UPDATE SKIP LOCKED, and GET /api/jobs/<id> returns the
+status and the persisted result. While a job runs, its worker extends
+the lock (heartbeat), so only jobs of dead or stuck workers are taken
+over. Handlers only add their result rows to the session; they are
+committed together with the job update, which only matches while the
+worker holds the lock, so a worker that lost it writes nothing.
+"""
+import argparse
+from datetime import datetime, timedelta
+import json
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import time
+from flask import current_app
+from sqlalchemy import text
+from models import db, Job, User, Paper, ResultAbstSummary, ResultAbstTranslation
+from set_log import setup_logger
+from lib.metrics import increment
+from lib.aio import run_sync
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# seconds a running job stays locked before another worker may take it
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "600"))
+# seconds between two extensions of the lock of a running job
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", str(JOB_VISIBILITY_TIMEOUT / 4)))
+# seconds a worker waits when the queue is empty
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# worker processes per job type (max jobs of a type running at once per host)
+JOB_CONCURRENCY = {
+    "abst_summary": int(os.getenv("JOB_CONCURRENCY_ABST_SUMMARY", "2")),
+    "abst_translation": int(os.getenv("JOB_CONCURRENCY_ABST_TRANSLATION", "4")),
+}
+
+DEQUEUE_SQL = text("""
+UPDATE jobs
+SET status = 'running', attempts = attempts + 1, locked_by = :worker_id,
+    locked_until = :locked_until, updated_at = :now
+WHERE id = (
+    SELECT id FROM jobs
+    WHERE job_type = :job_type
+      AND ((status = 'queued' AND run_at <= :now)
+           OR (status = 'running' AND locked_until < :now))
+    ORDER BY run_at, id
+    FOR UPDATE SKIP LOCKED
+    LIMIT 1
+)
+RETURNING id
+""")
+
+RENEW_SQL = text("""
+UPDATE jobs SET locked_until = :locked_until
+WHERE id = :id AND locked_by = :worker_id AND status = 'running'
+""")
+
+
+class PermanentJobError(Exception):
+    """A job failure that retrying will not fix."""
+
+
+def enqueue(job_type, payload, max_attempts=JOB_MAX_ATTEMPTS):
+    """Add a job to the queue.
+
+    Arguments:
+        job_type (string): key of JOB_HANDLERS
+        payload (dict): JSON serializable arguments of the handler
+
+    Returns:
+        Job
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f'Invalid job type: {job_type}')
+    job = Job(job_type=job_type, payload=json.dumps(payload), max_attempts=max_attempts)
+    job.insert()
+    increment(f"jobs.{job_type}.enqueued")
+    return job
+
+
+def dequeue(job_type, worker_id, visibility_timeout=JOB_VISIBILITY_TIMEOUT):
+    """Lock the next runnable job of job_type, or return None."""
+    now = datetime.now()
+    job_id = db.session.execute(DEQUEUE_SQL, {
+        "job_type": job_type,
+        "worker_id": worker_id,
+        "now": now,
+        "locked_until": now + timedelta(seconds=visibility_timeout),
+    }).scalar()
+    db.session.commit()
+    if job_id is None:
+        return None
+    return db.session.get(Job, job_id)
+
+
+class Heartbeat:
+    """Extend the lock of a running job from a thread until stopped.
+
+    Uses its own connection, so the handler's session is not touched.
+    lost is set when the job is no longer locked by worker_id.
+    """
+
+    def __init__(self, engine, job_id, worker_id, interval=JOB_HEARTBEAT_INTERVAL,
+                 visibility_timeout=JOB_VISIBILITY_TIMEOUT):
+        self.engine = engine
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self.visibility_timeout = visibility_timeout
+        self.lost = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def renew(self):
+        """Extend the lock once; returns False when it was lost."""
+        with self.engine.begin() as connection:
+            renewed = connection.execute(RENEW_SQL, {
+                "id": self.job_id,
+                "worker_id": self.worker_id,
+                "locked_until": datetime.now() + timedelta(seconds=self.visibility_timeout),
+            }).rowcount
+        return renewed > 0
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                renewed = self.renew()
+            except Exception as e:
+                logger.warning(f'Error extending the lock of job {self.job_id}: {e!r}')
+                continue
+            if not renewed:
+                self.lost = True
+                logger.warning(f'Job {self.job_id} is no longer locked by {self.worker_id}')
+                return
+
+
+def _finish(job, worker_id, **values):
+    # only the worker holding the lock may change a running job; rows
+    # added by the handler are committed in the same transaction, or
+    # rolled back with it
+    values["updated_at"] = datetime.now()
+    statement = db.update(Job).where(
+        Job.id == job.id, Job.locked_by == worker_id, Job.status == "running"
+    ).values(**values)
+    finished = db.session.execute(statement).rowcount > 0
+    if not finished:
+        db.session.rollback()
+        logger.warning(f'Job {job.id} is no longer locked by {worker_id}, not updating it')
+        increment(f"jobs.{job.job_type}.lock_lost")
+        return False
+    db.session.commit()
+    return True
+
+
+def complete(job, result, worker_id):
+    if _finish(job, worker_id, status="done", result=current_app.json.dumps(result),
+               error=None, locked_until=None):
+        increment(f"jobs.{job.job_type}.done")
+
+
+def fail(job, error, worker_id, retry=True):
+    # retry with jittered exponential backoff until max_attempts
+    if retry and job.attempts < job.max_attempts:
+        delay = random.uniform(0, min(300, 5 * 2 ** job.attempts))
+        if _finish(job, worker_id, status="queued", error=repr(error), locked_until=None,
+                   run_at=datetime.now() + timedelta(seconds=delay)):
+            increment(f"jobs.{job.job_type}.retried")
+    elif _finish(job, worker_id, status="failed", error=repr(error), locked_until=None):
+        increment(f"jobs.{job.job_type}.failed")
+
+
+def run_abst_summary(payload):
+    # same work as POST /api/users/<user_id>/results-abst-summary
+    from summarize import summarize_words, source_summaries
+    user = db.session.get(User, payload["user_id"])
+    if user is None:
+        raise PermanentJobError(f'User not found: {payload["user_id"]}')
+    result = run_sync(summarize_words(
+        payload["search_words"], payload["language"], payload.get("retmax", 5)
+    ))
+    if result is None:
+        raise PermanentJobError("No papers found")
+    summarized_abstract, summaries = result
+    result_abst_summary = ResultAbstSummary(
+        abst_summary=summarized_abstract,
+        language=payload["language"]
+    )
+    result_abst_summary.paper_summaries = source_summaries(summaries)
+    result_abst_summary.user = user
+    # committed by complete(), only if the job is still ours
+    db.session.add(result_abst_summary)
+    db.session.flush()
+    return {"result_abst_summary": result_abst_summary.format()}
+
+
+def run_abst_translation(payload):
+    # same work as POST /api/papers/<id>/results-abst-translation
+    from lib import translate_by_deepl
+    paper = db.session.get(Paper, payload["paper_id"])
+    if paper is None:
+        raise PermanentJobError(f'Paper not found: {payload["paper_id"]}')
+    translated_abstract = translate_by_deepl(paper.abstract, payload["language"])
+    result_abst_translation = ResultAbstTranslation(
+        translated_abstract=translated_abstract,
+        language=payload["language"]
+    )
+    result_abst_translation.paper = paper
+    # committed by complete(), only if the job is still ours
+    db.session.add(result_abst_translation)
+    db.session.flush()
+    return {"result_abst_translation": result_abst_translation.format()}
+
+
+JOB_HANDLERS = {
+    "abst_summary": run_abst_summary,
+    "abst_translation": run_abst_translation,
+}
+
+
+def run_job(job, worker_id):
+    if job.attempts > job.max_attempts:
+        # its last attempt timed out (visibility timeout)
+        fail(job, TimeoutError("Job timed out"), worker_id, retry=False)
+        return
+    try:
+        with Heartbeat(db.engine, job.id, worker_id) as heartbeat:
+            result = JOB_HANDLERS[job.job_type](json.loads(job.payload))
+        if heartbeat.lost:
+            # another worker runs the job now; drop this result
+            db.session.rollback()
+            logger.warning(f'Job {job.id} was taken over, dropping its result')
+            increment(f"jobs.{job.job_type}.lock_lost")
+            return
+    except PermanentJobError as e:
+        db.session.rollback()
+        logger.warning(f'Job {job.id} failed: {e}')
+        fail(job, e, worker_id, retry=False)
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f'Job {job.id} failed (attempt {job.attempts}): {e!r}')
+        fail(job, e, worker_id)
+    else:
+        complete(job, result, worker_id)
+        logger.info(f'Job {job.id} ({job.job_type}) done')
+
+
+def work(job_type, poll_interval=JOB_POLL_INTERVAL):
+    """Run jobs of job_type forever (one worker process)."""
+    from app import create_app
+    app = create_app()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f'Worker {worker_id} waiting for {job_type} jobs')
+    with app.app_context():
+        while True:
+            try:
+                job = dequeue(job_type, worker_id)
+            except Exception as e:
+                logger.warning(f'Error dequeuing {job_type} jobs: {e!r}')
+                db.session.rollback()
+                job = None
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            run_job(job, worker_id)
+            db.session.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--type", choices=sorted(JOB_HANDLERS), action="append",
+                        help="job type to run (default: all)")
+    args = parser.parse_args(argv)
+
+    processes = []
+    for job_type in args.type or sorted(JOB_HANDLERS):
+        for _ in range(JOB_CONCURRENCY[job_type]):
+            process = multiprocessing.Process(target=work, args=(job_type,), daemon=True)
+            process.start()
+            processes.append(process)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,10 @@
-from .pubmed import (get_paper_info, get_paper_abstract,
-                     get_pmids_from_words, get_paper_abstracts_from_words)
-from .deepl import (translate_by_deepl)
\ No newline at end of file
+from .pubmed import (get_paper_info, get_paper_infos,
+                     get_paper_abstract, get_paper_abstracts,
+                     get_pmids_from_words, get_paper_abstracts_from_words,
+                     search_pubmed_history, iter_history_pages,
+                     iter_pmids_from_words, fetch_pmids_from_history,
+                     fetch_paper_abstracts_from_history,
+                     fetch_paper_infos_from_history)
+from .deepl import (translate_by_deepl)
+from .pubmed_xml import (PubmedArticleParser, iter_pubmed_articles)
+from .metrics import (get_metrics)
\ No newline at end of file
@@ -0,0 +1,105 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+
+# one long-lived event loop per process, run by a daemon thread; clients
+# bound to it (httpx pools, the OpenAI client) survive between requests
+_loop = None
+_loop_thread = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+# tasks started with spawn(), referenced until they finish
+_background_tasks = set()
+
+
+def get_loop():
+    """Return the process wide event loop, starting it on first use.
+
+    A new loop is started after a fork (e.g. in gunicorn or
+    multiprocessing workers).
+    """
+    global _loop, _loop_thread, _loop_pid
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid() or not _loop_thread.is_alive():
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(
+                target=_loop.run_forever, name="event-loop", daemon=True
+            )
+            _loop_thread.start()
+            _loop_pid = os.getpid()
+        return _loop
+
+
+def run_sync(coro, timeout=None):
+    """Run coro on the process wide event loop and wait for its result.
+
+    This is the bridge for sync code such as Flask routes. The caller's
+    context variables (including Flask's app and request context) are
+    copied to the task.
+
+    Arguments:
+        coro (coroutine): coroutine to run
+        timeout (float): seconds to wait, or None; the task is cancelled
+            when it runs out
+
+    Returns:
+        the result of coro
+    """
+    loop = get_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError("run_sync() cannot be called from the event loop thread")
+    # the task is created in a copy of this thread's context
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+def submit(coro):
+    """Start coro on the process wide event loop without waiting for it.
+
+    Returns:
+        concurrent.futures.Future
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def spawn(coro):
+    """Run coro in the background on the running event loop.
+
+    Returns:
+        asyncio.Task
+    """
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+async def gather_bounded(factories, concurrency=10, timeout=None):
+    """Run coroutine factories with bounded concurrency.
+
+    Arguments:
+        factories (list): callables returning a coroutine; a coroutine is
+            only created once a slot is free
+        concurrency (int): max number of coroutines running at once
+        timeout (float): seconds each coroutine may take, or None
+
+    Returns:
+        list: results in input order; a failed or timed out coroutine
+            gives its exception instead of a result
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(factory):
+        async with semaphore:
+            if timeout is None:
+                return await factory()
+            return await asyncio.wait_for(factory(), timeout)
+
+    return await asyncio.gather(*[run(factory) for factory in factories],
+                                return_exceptions=True)
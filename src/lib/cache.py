@@ -0,0 +1,83 @@
+from collections import OrderedDict, namedtuple
+import threading
+import time
+import sys
+sys.path.append('../')
+from lib.metrics import increment
+
+# value: cached value, stored_at: unix time, is_stale: past its ttl
+CacheEntry = namedtuple("CacheEntry", ["value", "stored_at", "is_stale"])
+
+
+def entry_state(stored_at, ttl, stale_ttl, now=None):
+    """Return "fresh", "stale" or None (expired) for an entry stored at stored_at."""
+    age = (now if now is not None else time.time()) - stored_at
+    if age <= ttl:
+        return "fresh"
+    if age <= ttl + stale_ttl:
+        return "stale"
+    return None
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with per-entry TTL.
+
+    Entries older than their ttl are still returned (flagged as stale)
+    for another stale_ttl seconds so callers can serve them while they
+    refresh the value.
+
+    Arguments:
+        name (string): name used for metrics
+        maxsize (int): max number of entries
+        ttl (float): default seconds an entry is fresh
+        stale_ttl (float): seconds an expired entry can still be served
+    """
+
+    def __init__(self, name, maxsize=1024, ttl=3600, stale_ttl=0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the CacheEntry for key, or None when missing/expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                increment(f"{self.name}.miss")
+                return None
+            value, stored_at, ttl = item
+            state = entry_state(stored_at, ttl, self.stale_ttl)
+            if state is None:
+                del self._data[key]
+                increment(f"{self.name}.miss")
+                return None
+            self._data.move_to_end(key)
+            increment(f"{self.name}.{'hit' if state == 'fresh' else 'stale_hit'}")
+            return CacheEntry(value, stored_at, state == "stale")
+
+    def set(self, key, value, ttl=None, stored_at=None):
+        """Store value under key (ttl defaults to the cache ttl)."""
+        with self._lock:
+            self._data[key] = (
+                value,
+                stored_at if stored_at is not None else time.time(),
+                ttl if ttl is not None else self.ttl,
+            )
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                increment(f"{self.name}.evicted")
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
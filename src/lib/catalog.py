@@ -0,0 +1,33 @@
+import sys
+sys.path.append('../')
+from set_log import setup_logger
+from flask import has_app_context
+from lib.metrics import increment
+from lib.sessions import run_in_session
+from models import db, PubmedCatalog
+
+logger = setup_logger(__name__)
+
+
+def _read(session, pmids):
+    query = db.select(PubmedCatalog).where(PubmedCatalog.pmid.in_(pmids))
+    return {record.pmid: record for record in session.scalars(query)}
+
+
+async def get_catalog_records(pmids):
+    """Return {pmid: PubmedCatalog} for the pmids loaded by ingest_pubmed.py.
+
+    Deleted rows are returned too, so callers treat them as known
+    "no data" PMIDs. Returns {} outside an app context or on errors.
+    The records are read with a session of their own (run_in_session).
+    """
+    if not pmids or not has_app_context():
+        return {}
+    try:
+        records = await run_in_session(_read, pmids)
+    except Exception as e:
+        logger.warning(f'Error reading pubmed_catalog: {e}')
+        return {}
+    increment("pubmed_catalog.hit", len(records))
+    increment("pubmed_catalog.miss", len(pmids) - len(records))
+    return records
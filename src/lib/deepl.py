@@ -1,20 +1,27 @@
-import deepl
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-DEEPLE_API_KEY = os.environ["DEEPLE_API_KEY"]
-
 language_codes = {
     "English": "EN",
     "Japanese": "JA",
     "Chinese": "ZH",
 }
 
-def translate_by_deepl(text, target_lang, auth_key=DEEPLE_API_KEY):
-    # initialize the DeepL translator
-    translator = deepl.Translator(auth_key)
+# one translator (and connection pool) per key, kept between requests
+_translators = {}
+
+def translate_by_deepl(text, target_lang, auth_key=None):
+    # read when translating, so importing does not need the key
+    auth_key = auth_key or os.getenv("DEEPLE_API_KEY")
+    if not auth_key:
+        raise ValueError("DEEPLE_API_KEY is not set")
+    # get the DeepL translator, created on first use
+    translator = _translators.get(auth_key)
+    if translator is None:
+        import deepl
+        translator = _translators.setdefault(auth_key, deepl.Translator(auth_key))
 
     result = translator.translate_text(text, target_lang=language_codes[target_lang])
 
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import sys
+sys.path.append('../')
+from set_log import setup_logger
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+# connection pool settings for E-utilities (can be overridden by env)
+PUBMED_MAX_CONNECTIONS = int(os.getenv("PUBMED_MAX_CONNECTIONS", "20"))
+PUBMED_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("PUBMED_MAX_KEEPALIVE_CONNECTIONS", "10")
+)
+PUBMED_KEEPALIVE_EXPIRY = float(os.getenv("PUBMED_KEEPALIVE_EXPIRY", "30"))
+PUBMED_CONNECT_TIMEOUT = float(os.getenv("PUBMED_CONNECT_TIMEOUT", "5"))
+PUBMED_READ_TIMEOUT = float(os.getenv("PUBMED_READ_TIMEOUT", "30"))
+PUBMED_POOL_TIMEOUT = float(os.getenv("PUBMED_POOL_TIMEOUT", "10"))
+PUBMED_HTTP2 = os.getenv("PUBMED_HTTP2", "false").lower() == "true"
+
+# one client per event loop (httpx connections cannot be shared across loops);
+# the app runs everything on the long-lived loop of lib/aio, other loops
+# (scripts, benchmarks) must call close_client() before they end
+_clients = {}
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_client(
+        max_connections=PUBMED_MAX_CONNECTIONS,
+        max_keepalive_connections=PUBMED_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=PUBMED_KEEPALIVE_EXPIRY,
+        connect_timeout=PUBMED_CONNECT_TIMEOUT,
+        read_timeout=PUBMED_READ_TIMEOUT,
+        pool_timeout=PUBMED_POOL_TIMEOUT,
+        http2=PUBMED_HTTP2,
+):
+    """Create a new pooled AsyncClient for E-utilities.
+
+    Arguments:
+        max_connections (int): max number of open connections
+        max_keepalive_connections (int): max number of idle connections
+        keepalive_expiry (float): seconds an idle connection is kept
+        connect_timeout (float): connect timeout in seconds
+        read_timeout (float): read/write timeout in seconds
+        pool_timeout (float): seconds to wait for a free connection
+        http2 (bool): use HTTP/2 (requires the h2 package)
+
+    Returns:
+        httpx.AsyncClient
+    """
+    if http2 and not _http2_available():
+        logger.warning("h2 is not installed, falling back to HTTP/1.1")
+        http2 = False
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    timeout = httpx.Timeout(
+        read_timeout,
+        connect=connect_timeout,
+        pool=pool_timeout,
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+
+
+def get_client():
+    """Return the long-lived AsyncClient bound to the running event loop.
+
+    The client lives until close_client() is awaited on the same loop.
+    """
+    loop = asyncio.get_running_loop()
+    # a client whose loop was closed without close_client() can no longer
+    # be closed; drop it so that it does not pile up
+    for closed_loop in [l for l in _clients if l.is_closed()]:
+        client = _clients.pop(closed_loop)
+        if not client.is_closed:
+            logger.warning("E-utilities client was not closed before its event loop ended")
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = create_client()
+        _clients[loop] = client
+    return client
+
+
+async def close_client():
+    """Close the AsyncClient bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
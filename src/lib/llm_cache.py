@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+sys.path.append('../')
+from set_log import setup_logger
+from flask import has_app_context
+from sqlalchemy.dialects.postgresql import insert
+from lib.cache import LRUCache
+from lib.metrics import increment, set_gauge
+from lib.sessions import run_in_session
+from models import db, LLMResponse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+# seconds a cached response is used, rows older than that are deleted
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(30 * 24 * 3600)))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+# seconds between two purges of expired rows (per process)
+LLM_CACHE_PURGE_INTERVAL = float(os.getenv("LLM_CACHE_PURGE_INTERVAL", "3600"))
+
+
+def prompt_fingerprint(prompt, ai_model_id, execution_settings):
+    """Return a hash of everything besides the variables that shapes a response.
+
+    Arguments:
+        prompt (string): prompt template
+        ai_model_id (string): OpenAI model id
+        execution_settings (OpenAIChatPromptExecutionSettings): sampling settings
+
+    Returns:
+        string: sha256 hex digest
+    """
+    settings = execution_settings.model_dump(mode="json", exclude_none=True)
+    data = json.dumps({
+        "prompt": prompt,
+        "ai_model_id": ai_model_id,
+        "execution_settings": settings,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def response_key(fingerprint, context_variables):
+    """Return the cache key of a call (sha256 hex digest)."""
+    data = json.dumps({
+        "fingerprint": fingerprint,
+        "variables": context_variables or {},
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class LLMResponseCache:
+    """Two level cache of LLM responses keyed by response_key().
+
+    Level 1 is an in-process LRU, level 2 is the llm_responses table.
+    The table is only used inside a Flask app context.
+    """
+
+    def __init__(self, ttl=LLM_CACHE_TTL, maxsize=LLM_CACHE_SIZE,
+                 purge_interval=LLM_CACHE_PURGE_INTERVAL):
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.memory = LRUCache("llm_cache.memory", maxsize=maxsize, ttl=ttl)
+        self._hits = 0
+        self._lookups = 0
+        self._last_purge = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _read(self, session, key):
+        query = db.select(LLMResponse).where(
+            LLMResponse.key == key,
+            LLMResponse.created_at >= datetime.now() - timedelta(seconds=self.ttl)
+        )
+        return session.scalars(query).first()
+
+    @staticmethod
+    def _write(session, key, module_name, response):
+        statement = insert(LLMResponse).values(
+            key=key, module_name=module_name, response=response,
+            created_at=datetime.now()
+        ).on_conflict_do_update(
+            index_elements=["key"],
+            set_={"response": response, "created_at": datetime.now()},
+        )
+        session.execute(statement)
+        session.commit()
+
+    def _purge(self, session):
+        statement = db.delete(LLMResponse).where(
+            LLMResponse.created_at < datetime.now() - timedelta(seconds=self.ttl)
+        )
+        deleted = session.execute(statement).rowcount
+        session.commit()
+        return deleted
+
+    async def get(self, key):
+        """Return the cached response for key, or None."""
+        entry = self.memory.get(key)
+        response = entry.value if entry is not None else None
+        if response is None and has_app_context():
+            try:
+                record = await run_in_session(self._read, key)
+            except Exception as e:
+                logger.warning(f'Error reading llm_responses: {e}')
+                record = None
+            if record is not None:
+                response = record.response
+                self.memory.set(key, response, stored_at=record.created_at.timestamp())
+                increment("llm_cache.db.hit")
+        self._count(response is not None)
+        return response
+
+    async def set(self, key, module_name, response):
+        """Store response under key."""
+        self.memory.set(key, response)
+        if not has_app_context():
+            return
+        try:
+            await run_in_session(self._write, key, module_name, response)
+        except Exception as e:
+            logger.warning(f'Error writing llm_responses: {e}')
+        await self._purge_if_due()
+
+    def _count(self, hit):
+        with self._lock:
+            self._lookups += 1
+            if hit:
+                self._hits += 1
+            hit_rate = self._hits / self._lookups
+        increment(f"llm_cache.{'hit' if hit else 'miss'}")
+        set_gauge("llm_cache.hit_rate", round(hit_rate, 3))
+
+    async def _purge_if_due(self):
+        with self._lock:
+            if time.monotonic() - self._last_purge < self.purge_interval:
+                return
+            self._last_purge = time.monotonic()
+        try:
+            deleted = await run_in_session(self._purge)
+        except Exception as e:
+            logger.warning(f'Error purging llm_responses: {e}')
+            return
+        increment("llm_cache.purged", deleted)
+
+
+llm_cache = LLMResponseCache()
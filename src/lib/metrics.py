@@ -0,0 +1,39 @@
+from collections import Counter
+import threading
+
+# process-wide counters and gauges, exposed by GET /api/metrics
+_counters = Counter()
+_gauges = {}
+_lock = threading.Lock()
+
+
+def increment(name, value=1):
+    """Increase the counter called name by value."""
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name, value):
+    """Set the gauge called name to value."""
+    with _lock:
+        _gauges[name] = value
+
+
+def get_metrics():
+    """Return a snapshot of all counters and gauges.
+
+    Returns:
+        dict: {"counters": {...}, "gauges": {...}}
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+        }
+
+
+def reset_metrics():
+    """Clear all counters and gauges."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import time
+sys.path.append('../')
+from set_log import setup_logger
+from lib.metrics import increment, set_gauge
+from lib.ratelimit import TokenBucket, parse_retry_after, backoff_delay
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+# limits of the OpenAI organization (requests and tokens per minute)
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+# seconds of budget that may be used in one burst
+OPENAI_RATE_BURST = float(os.getenv("OPENAI_RATE_BURST", "10"))
+OPENAI_RATE_LIMIT_DIR = os.getenv("OPENAI_RATE_LIMIT_DIR", tempfile.gettempdir())
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+# upper bound of a delay asked for by the rate limit headers
+OPENAI_MAX_RETRY_DELAY = float(os.getenv("OPENAI_MAX_RETRY_DELAY", "60"))
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value):
+    """Convert an x-ratelimit-reset-* header ("1s", "6m0s", "20ms") to seconds."""
+    if not value:
+        return None
+    parts = _DURATION.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _UNITS[unit] for number, unit in parts)
+
+
+def error_response(error):
+    """Return (status code, headers) of the HTTP error behind an exception.
+
+    semantic_kernel wraps the openai errors, so the cause chain is
+    searched. Returns (None, {}) when there was no HTTP response.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status = getattr(error, "status_code", None)
+        if isinstance(status, int):
+            response = getattr(error, "response", None)
+            return status, getattr(response, "headers", None) or {}
+        error = error.__cause__ or error.__context__
+    return None, {}
+
+
+def retry_delay(headers, attempt):
+    """Seconds to wait before retrying, from the rate limit headers.
+
+    retry-after-ms / retry-after win, then the reset time of the
+    exhausted limit; jitter is added so workers do not retry together.
+    """
+    delay = None
+    if headers.get("retry-after-ms"):
+        try:
+            delay = float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if delay is None:
+        delay = parse_retry_after(headers.get("retry-after"))
+    if delay is None:
+        resets = [
+            parse_reset(headers.get(f"x-ratelimit-reset-{kind}"))
+            for kind in ("requests", "tokens")
+            if headers.get(f"x-ratelimit-remaining-{kind}") == "0"
+        ]
+        resets = [reset for reset in resets if reset is not None]
+        delay = max(resets) if resets else None
+    if delay is None:
+        return backoff_delay(attempt)
+    return min(OPENAI_MAX_RETRY_DELAY, delay) + backoff_delay(attempt, base=0.25, cap=2.0)
+
+
+class OpenAILimiter:
+    """Requests and tokens per minute limiter for OpenAI calls.
+
+    Each call reserves one request and its estimated tokens (prompt
+    tokens + max_tokens) from two TokenBuckets whose state is shared by
+    every worker on the host. Reservations are served in arrival order;
+    unused tokens are given back once the completion size is known.
+
+    Metrics: openai.requests, openai.queued (calls that had to wait),
+    openai.queue_seconds, the gauge openai.waiting and openai.paused.
+
+    Arguments:
+        rpm (float): requests per minute
+        tpm (float): tokens per minute
+        burst (float): seconds of budget usable at once
+        state_dir (string): directory of the shared state files, or None
+            to keep the state in this process only
+    """
+
+    def __init__(self, rpm=OPENAI_RPM, tpm=OPENAI_TPM, burst=OPENAI_RATE_BURST,
+                 state_dir=OPENAI_RATE_LIMIT_DIR):
+        def state_path(name):
+            return os.path.join(state_dir, f"{name}_rate_limit.json") if state_dir else None
+
+        self.requests = TokenBucket("openai_rpm", rate=rpm / 60,
+                                    capacity=max(1.0, rpm / 60 * burst),
+                                    state_path=state_path("openai_rpm"))
+        self.tokens = TokenBucket("openai_tpm", rate=tpm / 60,
+                                  capacity=tpm / 60 * burst,
+                                  state_path=state_path("openai_tpm"))
+        self._waiting = 0
+
+    async def acquire(self, tokens):
+        """Wait until one request and tokens fit the limits, and take them.
+
+        A caller cancelled (or timed out) while waiting gives its
+        reservation back, so it does not delay the callers behind it.
+        """
+        wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        increment("openai.requests")
+        if wait <= 0:
+            return
+        increment("openai.queued")
+        increment("openai.queue_seconds", round(wait, 3))
+        self._waiting += 1
+        set_gauge("openai.waiting", self._waiting)
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self.requests.release(1)
+            self.tokens.release(tokens)
+            increment("openai.queue_cancelled")
+            raise
+        finally:
+            self._waiting -= 1
+            set_gauge("openai.waiting", self._waiting)
+
+    def release(self, tokens):
+        """Give back reserved tokens that the call did not use."""
+        self.tokens.release(tokens)
+
+    def pause(self, seconds):
+        """Hold every worker's calls for seconds (after a 429)."""
+        increment("openai.paused")
+        self.requests.hold(seconds)
+
+
+openai_limiter = OpenAILimiter()
+
+
+async def call_with_limits(factory, tokens, timeout, limiter=openai_limiter,
+                           max_retries=OPENAI_MAX_RETRIES):
+    """Run factory() under the limiter, retrying 429 and 5xx responses.
+
+    The tokens of a failed attempt (error, 429 or timeout) are given
+    back to the limiter; the caller releases the unused part of a
+    successful one.
+
+    Arguments:
+        factory (callable): returns the coroutine of one call
+        tokens (int): estimated tokens of the call (prompt + max_tokens)
+        timeout (float): seconds each attempt may take
+
+    Returns:
+        the result of the call
+    """
+    for attempt in range(max_retries + 1):
+        await limiter.acquire(tokens)
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(factory(), timeout=timeout)
+        except asyncio.CancelledError:
+            limiter.release(tokens)
+            raise
+        except Exception as e:
+            limiter.release(tokens)
+            status, headers = error_response(e)
+            if status not in RETRY_STATUS_CODES or attempt == max_retries:
+                raise
+            increment(f"openai.status.{status}")
+            delay = retry_delay(headers, attempt)
+            logger.warning(f'OpenAI returned {status} after '
+                           f'{time.perf_counter() - start:.2f} sec, '
+                           f'retrying in {delay:.2f} sec')
+            increment("openai.retried")
+        if status == 429:
+            # the budget is spent: every caller waits in acquire, not only this one
+            limiter.pause(delay)
+        else:
+            await asyncio.sleep(delay)
@@ -1,19 +1,94 @@
 import asyncio
 import httpx
 import json
+import os
 import sys
 import logging
+import tempfile
 sys.path.append('../')
 from set_log import setup_logger
-import xml.etree.ElementTree as ET
+from lib.http_client import get_client, close_client
+from lib.metrics import increment
+from lib.ratelimit import TokenBucket, parse_retry_after, backoff_delay
+from lib.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, hedged
+from lib.cache import LRUCache
+from lib.aio import gather_bounded
+from lib.record_cache import record_cache
+from lib.catalog import get_catalog_records
+from lib.singleflight import SingleFlight
+from lib.pubmed_xml import PubmedArticleParser
 import time
+from functools import partial
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
 
 
 logger = setup_logger(__name__)
 
-ESEARCH_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-ESUMMARY_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
-EFETCH_BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+# can point to a local stand-in server (see bench/fake_eutils.py)
+EUTILS_BASE_URL = os.getenv("EUTILS_BASE_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+ESEARCH_BASE_URL = f"{EUTILS_BASE_URL}/esearch.fcgi"
+ESUMMARY_BASE_URL = f"{EUTILS_BASE_URL}/esummary.fcgi"
+EFETCH_BASE_URL = f"{EUTILS_BASE_URL}/efetch.fcgi"
+
+# NCBI identification and rate limit (3 req/s without api key, 10 req/s with)
+NCBI_API_KEY = os.getenv("NCBI_API_KEY")
+NCBI_TOOL = os.getenv("NCBI_TOOL", "paper-app-backend")
+NCBI_EMAIL = os.getenv("NCBI_EMAIL")
+NCBI_RATE_LIMIT = float(os.getenv("NCBI_RATE_LIMIT", "10" if NCBI_API_KEY else "3"))
+NCBI_RATE_LIMIT_FILE = os.getenv(
+    "NCBI_RATE_LIMIT_FILE", os.path.join(tempfile.gettempdir(), "ncbi_rate_limit.json")
+)
+NCBI_MAX_RETRIES = int(os.getenv("NCBI_MAX_RETRIES", "4"))
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# shared by all workers on the host through NCBI_RATE_LIMIT_FILE
+ncbi_limiter = TokenBucket(
+    "pubmed", rate=NCBI_RATE_LIMIT, state_path=NCBI_RATE_LIMIT_FILE
+)
+
+# a duplicate request is sent when the first one is slower than this
+# percentile of recent latencies (0 disables hedging)
+PUBMED_HEDGE_PERCENTILE = float(os.getenv("PUBMED_HEDGE_PERCENTILE", "95"))
+eutils_latency = LatencyTracker()
+
+# fail fast while E-utilities is failing (state on GET /api/metrics)
+eutils_breaker = CircuitBreaker(
+    "pubmed_breaker",
+    error_rate=float(os.getenv("PUBMED_BREAKER_ERROR_RATE", "0.5")),
+    window=float(os.getenv("PUBMED_BREAKER_WINDOW", "30")),
+    min_calls=int(os.getenv("PUBMED_BREAKER_MIN_CALLS", "10")),
+    reset_timeout=float(os.getenv("PUBMED_BREAKER_RESET_TIMEOUT", "30")),
+)
+
+# search result cache; entries also expire at PubMed's daily update
+PUBMED_SEARCH_CACHE_SIZE = int(os.getenv("PUBMED_SEARCH_CACHE_SIZE", "1024"))
+PUBMED_SEARCH_CACHE_TTL = float(os.getenv("PUBMED_SEARCH_CACHE_TTL", str(24 * 3600)))
+PUBMED_DAILY_UPDATE_HOUR_UTC = int(os.getenv("PUBMED_DAILY_UPDATE_HOUR_UTC", "7"))
+
+# expired results are only served when ESearch fails
+PUBMED_SEARCH_CACHE_STALE_TTL = float(os.getenv("PUBMED_SEARCH_CACHE_STALE_TTL", str(7 * 24 * 3600)))
+
+search_cache = LRUCache("pubmed_search_cache", maxsize=PUBMED_SEARCH_CACHE_SIZE,
+                        ttl=PUBMED_SEARCH_CACHE_TTL, stale_ttl=PUBMED_SEARCH_CACHE_STALE_TTL)
+
+# concurrent identical lookups share one outbound request
+pubmed_flight = SingleFlight("pubmed_singleflight")
+
+# max number of concurrent E-utilities requests per call, and their timeout
+PUBMED_CONCURRENCY = int(os.getenv("PUBMED_CONCURRENCY", "4"))
+PUBMED_REQUEST_TIMEOUT = float(os.getenv("PUBMED_REQUEST_TIMEOUT", "30"))
+
+# max number of PMIDs sent in one EFetch request
+EFETCH_CHUNK_SIZE = 200
+# max number of PMIDs sent in one ESummary request
+ESUMMARY_CHUNK_SIZE = 500
+# NCBI asks for POST instead of GET when sending more than 200 UIDs
+ESUMMARY_POST_THRESHOLD = 200
+# page size used when reading from the E-utilities history server
+HISTORY_PAGE_SIZE = 500
 
 def measure_performance(func):
     def wrapper(*args, **kwargs):
@@ -25,27 +100,108 @@ def measure_performance(func):
         return result
     return wrapper
 
+def split_into_chunks(items, chunk_size):
+    # split list into lists of at most chunk_size items
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+async def request_eutils(url, params, method="GET", stream=False):
+    """Send a rate limited request to E-utilities.
+
+    Adds api_key/tool/email to the parameters, waits for the shared rate
+    limiter and retries 429/5xx responses and network errors with jittered
+    exponential backoff (honoring Retry-After). A slow request is hedged
+    with a duplicate when the rate limit allows it, and no request is sent
+    while the circuit breaker is open.
+
+    Arguments:
+        url (string): E-utilities endpoint
+        params (dict): query parameters (sent as form data for POST)
+        method (string): "GET" or "POST"
+        stream (bool): do not read the body; the caller must call
+            response.aclose()
+
+    Returns:
+        httpx.Response
+
+    Raises:
+        CircuitOpenError: E-utilities is failing, the request was not sent
+    """
+    params = {k: v for k, v in params.items() if v is not None}
+    if NCBI_API_KEY:
+        params["api_key"] = NCBI_API_KEY
+    if NCBI_TOOL:
+        params["tool"] = NCBI_TOOL
+    if NCBI_EMAIL:
+        params["email"] = NCBI_EMAIL
+
+    async def send():
+        client = get_client()
+        if method == "POST":
+            request = client.build_request("POST", url, data=params)
+        else:
+            request = client.build_request("GET", url, params=params)
+        start = time.perf_counter()
+        response = await client.send(request, stream=stream)
+        eutils_latency.add(time.perf_counter() - start)
+        return response
+
+    def can_hedge():
+        # hedges only use spare rate limit budget
+        if not ncbi_limiter.try_acquire():
+            return False
+        increment("pubmed.requests")
+        return True
+
+    async def discard(response):
+        await response.aclose()
+
+    for attempt in range(NCBI_MAX_RETRIES + 1):
+        if not eutils_breaker.allow():
+            raise CircuitOpenError("E-utilities circuit breaker is open")
+        await ncbi_limiter.acquire()
+        increment("pubmed.requests")
+        delay = eutils_latency.percentile(PUBMED_HEDGE_PERCENTILE) \
+            if PUBMED_HEDGE_PERCENTILE else None
+        try:
+            response = await hedged(send, delay, can_hedge, discard, name="pubmed.hedge")
+        except httpx.TransportError as e:
+            eutils_breaker.record_failure()
+            if attempt == NCBI_MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f'E-utilities request failed ({e!r}), retrying in {delay:.2f} sec')
+        else:
+            if response.status_code >= 500:
+                eutils_breaker.record_failure()
+            else:
+                eutils_breaker.record_success()
+            if response.status_code not in RETRY_STATUS_CODES \
+                    or attempt == NCBI_MAX_RETRIES:
+                if response.is_error:
+                    await response.aclose()
+                response.raise_for_status()
+                return response
+            await response.aclose()
+            if response.status_code == 429:
+                increment("pubmed.rate_limited")
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            logger.warning(f'E-utilities returned {response.status_code}, retrying in {delay:.2f} sec')
+        increment("pubmed.retried")
+        await asyncio.sleep(delay)
+
+
 async def get_paper_info(pmid):
-    # Get paper info from pubmed using PMID
-    params = {
-        "db": "pubmed",
-        "id": str(pmid),
-        "retmode": "json"
-    }
-    try:
-        async with httpx.AsyncClient() as client:
-            # send request to pubmed
-            json_response = await client.get(ESUMMARY_BASE_URL, params=params)
-            # change json_response to python object
-            response = json.loads(json_response.content)
-            logger.info(f'Successfully retrieved paper info for PMID: {pmid}')
-    except Exception as e:
+    # Get paper info from pubmed (through the record cache) using PMID
+    paper_info = (await get_paper_infos([pmid]))[str(pmid)]
+    if paper_info is None:
         logger.error(f'Error retrieving paper info for PMID: {pmid}')
-        logger.error(e)
-        return None
-    
-    result = response['result']
-    paper_info = result[str(pmid)]
+    return paper_info
+
+
+def format_paper_info(pmid, paper_info):
+    # convert an ESummary document to the paper info dict
     title = paper_info['title']
     last_author = paper_info['lastauthor']
     publication_date = paper_info['pubdate']
@@ -60,41 +216,212 @@ async def get_paper_info(pmid):
     }
 
 
-def get_paper_abstract(pmid):
-    # Get paper abstract from pubmed using PMID
-    params = {
-        "db": "pubmed",
-        "id": str(pmid),
-        "retmode": "XML",
-    }
-    try:
-        # send request to pubmed
-        xml_response = httpx.get(EFETCH_BASE_URL, params=params)
-        logger.info(f'Successfully retrieved paper abstract for PMID: {pmid}')
-    except Exception as e:
+async def get_paper_infos(pmids, chunk_size=ESUMMARY_CHUNK_SIZE,
+                          concurrency=PUBMED_CONCURRENCY, timeout=PUBMED_REQUEST_TIMEOUT):
+    # Get paper info of many papers, reading through the record cache.
+    # Returns {pmid: paper info}; paper info is None when it is not available.
+    pmids = [str(pmid) for pmid in pmids]
+    paper_infos = await pubmed_flight.do(
+        ("summary", tuple(pmids)),
+        partial(_get_paper_infos, pmids, chunk_size, concurrency, timeout)
+    )
+    return paper_infos
+
+
+async def _get_paper_infos(pmids, chunk_size, concurrency, timeout):
+    # the local catalog (ingest_pubmed.py) is used before the network
+    paper_infos = {}
+    catalog = await get_catalog_records(pmids)
+    for pmid, record in catalog.items():
+        if record.deleted:
+            paper_infos[pmid] = None
+            continue
+        paper_infos[pmid] = format_paper_info(pmid, {
+            'title': record.title,
+            'lastauthor': record.last_author,
+            'pubdate': record.publication_date
+        })
+    missing = [pmid for pmid in pmids if pmid not in paper_infos]
+
+    async def fetch(missing):
+        return await fetch_paper_infos(missing, chunk_size, concurrency, timeout)
+
+    if missing:
+        paper_infos.update(await record_cache.read_through("summary", missing, fetch))
+    return {pmid: paper_infos[pmid] for pmid in pmids}
+
+
+async def fetch_paper_infos(pmids, chunk_size=ESUMMARY_CHUNK_SIZE,
+                            concurrency=PUBMED_CONCURRENCY, timeout=PUBMED_REQUEST_TIMEOUT):
+    # Get paper info of many papers with one ESummary request per chunk;
+    # chunks are requested concurrently.
+    # Returns {pmid: paper info} for the chunks PubMed answered.
+    async def fetch_chunk(chunk):
+        params = {
+            "db": "pubmed",
+            "id": ",".join(chunk),
+            "retmode": "json"
+        }
+        # send request to pubmed (POST for long id lists)
+        if len(chunk) > ESUMMARY_POST_THRESHOLD:
+            json_response = await request_eutils(ESUMMARY_BASE_URL, params, method="POST")
+        else:
+            json_response = await request_eutils(ESUMMARY_BASE_URL, params)
+        # change json_response to python object
+        response = json.loads(json_response.content)
+        logger.info(f'Successfully retrieved {len(chunk)} paper infos')
+
+        result = response.get('result', {})
+        paper_infos = {}
+        for pmid in chunk:
+            paper_info = result.get(pmid)
+            if paper_info is None or 'error' in paper_info:
+                paper_infos[pmid] = None
+                continue
+            try:
+                paper_infos[pmid] = format_paper_info(pmid, paper_info)
+            except KeyError as e:
+                logger.error(f'Error parsing paper info for PMID: {pmid}')
+                logger.error(e)
+        return paper_infos
+
+    return await fetch_chunks(fetch_chunk, split_into_chunks(pmids, chunk_size),
+                              concurrency, timeout, "paper infos")
+
+
+async def fetch_chunks(fetch_chunk, chunks, concurrency, timeout, description):
+    # run fetch_chunk for every chunk with bounded concurrency and merge the
+    # results; a failed or timed out chunk is logged and left out
+    results = await gather_bounded(
+        [partial(fetch_chunk, chunk) for chunk in chunks], concurrency, timeout
+    )
+    merged = {}
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, BaseException):
+            logger.error(f'Error retrieving {description} for PMIDs: {chunk}')
+            logger.error(repr(result))
+            continue
+        merged.update(result)
+    return merged
+
+
+async def get_paper_abstract(pmid):
+    # Get paper abstract from pubmed (through the record cache) using PMID
+    abstract = (await get_paper_abstracts([pmid]))[str(pmid)]
+    if abstract is None:
         logger.error(f'Error retrieving paper abstract for PMID: {pmid}')
-        logger.error(e)
-        return None
+    return abstract
 
-    # parse XML response
+
+async def stream_pubmed_articles(params, method="GET"):
+    # Send an EFetch request and yield one record per PubmedArticle
+    # while the response is being downloaded (see lib/pubmed_xml.py)
+    params = dict(params, db="pubmed", retmode="xml")
+    response = await request_eutils(EFETCH_BASE_URL, params, method=method, stream=True)
     try:
-        root = ET.fromstring(xml_response.content)
-        abstract = root.find('.//AbstractText').text
-    except Exception as e:
-        logger.error(f'Error parsing XML response for PMID: {pmid}')
-        logger.error(e)
-        return None
-    
-    return abstract
+        parser = PubmedArticleParser()
+        async for data in response.aiter_bytes():
+            for record in parser.feed(data):
+                yield record
+        for record in parser.close():
+            yield record
+    finally:
+        await response.aclose()
+
 
-async def get_pmids_from_words(words, retmax=5, minyear=None, maxyear=None):
+async def get_paper_abstracts(pmids, chunk_size=EFETCH_CHUNK_SIZE,
+                              concurrency=PUBMED_CONCURRENCY, timeout=PUBMED_REQUEST_TIMEOUT):
+    # Get abstracts of many papers, reading through the record cache.
+    # Returns {pmid: abstract}; abstract is None when it is not available.
+    pmids = [str(pmid) for pmid in pmids]
+    abstracts = await pubmed_flight.do(
+        ("abstract", tuple(pmids)),
+        partial(_get_paper_abstracts, pmids, chunk_size, concurrency, timeout)
+    )
+    return abstracts
+
+
+async def _get_paper_abstracts(pmids, chunk_size, concurrency, timeout):
+    # the local catalog (ingest_pubmed.py) is used before the network
+    catalog = await get_catalog_records(pmids)
+    abstracts = {
+        pmid: None if record.deleted else record.abstract
+        for pmid, record in catalog.items()
+    }
+    missing = [pmid for pmid in pmids if pmid not in abstracts]
+
+    async def fetch(missing):
+        return await fetch_paper_abstracts(missing, chunk_size, concurrency, timeout)
+
+    if missing:
+        abstracts.update(await record_cache.read_through("abstract", missing, fetch))
+    return {pmid: abstracts[pmid] for pmid in pmids}
+
+
+async def fetch_paper_abstracts(pmids, chunk_size=EFETCH_CHUNK_SIZE,
+                                concurrency=PUBMED_CONCURRENCY, timeout=PUBMED_REQUEST_TIMEOUT):
+    # Get abstracts of many papers with one EFetch request per chunk;
+    # chunks are requested concurrently.
+    # Returns {pmid: abstract} for the chunks PubMed answered.
+    async def fetch_chunk(chunk):
+        params = {
+            "id": ",".join(chunk),
+        }
+        parsed = {}
+        # send request to pubmed and parse the XML as it arrives
+        async for record in stream_pubmed_articles(params):
+            parsed[record["pmid"]] = record["abstract"]
+        logger.info(f'Successfully retrieved {len(chunk)} paper abstracts')
+        return {pmid: parsed.get(pmid) for pmid in chunk}
+
+    return await fetch_chunks(fetch_chunk, split_into_chunks(pmids, chunk_size),
+                              concurrency, timeout, "paper abstracts")
+
+def normalize_words(words):
+    # lowercase, trim, de-duplicate and sort search words
+    return sorted({word.strip().lower() for word in words if word.strip()})
+
+
+def normalize_query(words, retmax=5, minyear=None, maxyear=None):
+    # search cache key
+    return (tuple(normalize_words(words)), int(retmax), minyear, maxyear)
+
+
+def seconds_until_daily_update(now=None):
+    # seconds until PubMed's next daily update (PUBMED_DAILY_UPDATE_HOUR_UTC)
+    now = now or datetime.now(timezone.utc)
+    update = now.replace(hour=PUBMED_DAILY_UPDATE_HOUR_UTC, minute=0,
+                         second=0, microsecond=0)
+    if update <= now:
+        update += timedelta(days=1)
+    return (update - now).total_seconds()
+
+
+async def get_pmids_from_words(words, retmax=5, minyear=None, maxyear=None, use_cache=True):
     # validate mindate and maxdate
     if minyear and maxyear:
         if minyear > maxyear:
             logger.error("minyear should be less than maxyear")
             return None
-    
-    # join words list to string
+
+    # concurrent identical searches share one ESearch request
+    cache_key = normalize_query(words, retmax, minyear, maxyear)
+    pmid_list = await pubmed_flight.do(
+        ("search", cache_key, use_cache),
+        partial(_get_pmids_from_words, cache_key, words, use_cache)
+    )
+    return pmid_list
+
+
+async def _get_pmids_from_words(cache_key, words, use_cache):
+    _, retmax, minyear, maxyear = cache_key
+    # return cached result for the same normalized query
+    entry = search_cache.get(cache_key) if use_cache else None
+    if entry is not None and not entry.is_stale:
+        return list(entry.value)
+
+    # join words list to string; PubMed gets the words as given, the
+    # normalized form is only the cache key
     search_phrase = ",".join(words)
 
     # Get pmids from pubmed using search words
@@ -108,32 +435,40 @@ async def get_pmids_from_words(words, retmax=5, minyear=None, maxyear=None):
         "maxdate": maxyear
     }
     try:
-        async with httpx.AsyncClient() as client:
-            # send request to pubmed
-            json_response = await client.get(ESEARCH_BASE_URL, params=params)
-            # change json_response to python object
-            response = json.loads(json_response.content)
-            logger.info(f'Successfully retrieved paper info for words: {words}')
+        # send request to pubmed
+        json_response = await request_eutils(ESEARCH_BASE_URL, params)
+        # change json_response to python object
+        response = json.loads(json_response.content)
+        logger.info(f'Successfully retrieved paper info for words: {words}')
     except Exception as e:
         logger.error(f'Error retrieving paper info for words: {words}')
         logger.error(e)
+        if entry is not None:
+            # PubMed is failing; an old result is better than none
+            increment("pubmed_search_cache.served_stale")
+            return list(entry.value)
         return None
     
     result = response['esearchresult']
     pmid_list = result['idlist']
 
+    ttl = min(PUBMED_SEARCH_CACHE_TTL, seconds_until_daily_update())
+    search_cache.set(cache_key, tuple(pmid_list), ttl=ttl)
+
     return pmid_list
 
-async def get_paper_abstracts_from_words(words, retmax=5, minyear=None, maxyear=None):
-    pmid_list = await get_pmids_from_words(words, retmax, minyear, maxyear)
+async def get_paper_abstracts_from_words(words, retmax=5, minyear=None, maxyear=None,
+                                         use_cache=True, chunk_size=EFETCH_CHUNK_SIZE,
+                                         concurrency=PUBMED_CONCURRENCY,
+                                         timeout=PUBMED_REQUEST_TIMEOUT):
+    # Returns the available abstracts in PMID order; PMIDs whose request
+    # failed or timed out are skipped instead of failing the whole search.
+    pmid_list = await get_pmids_from_words(words, retmax, minyear, maxyear, use_cache)
     if pmid_list:
-        # abstract_list = await asyncio.gather(
-        #     *[get_paper_abstract(pmid) for pmid in pmid_list]
-        # )
-        # return abstract_list
+        abstracts = await get_paper_abstracts(pmid_list, chunk_size, concurrency, timeout)
         abstract_list = []
         for pmid in pmid_list:
-            abstract = get_paper_abstract(pmid)
+            abstract = abstracts[str(pmid)]
             if abstract:
                 abstract_list.append(abstract)
             else:
@@ -143,12 +478,138 @@ async def get_paper_abstracts_from_words(words, retmax=5, minyear=None, maxyear=
         return None
 
 
+async def search_pubmed_history(words, minyear=None, maxyear=None):
+    # Run ESearch with usehistory=y and keep the result set on NCBI's
+    # history server. Returns {"webenv", "query_key", "count"}.
+    if minyear and maxyear:
+        if minyear > maxyear:
+            logger.error("minyear should be less than maxyear")
+            return None
+
+    params = {
+        "db": "pubmed",
+        "term": ",".join(words),
+        "datatype": "pdat",
+        "retmode": "json",
+        "retmax": 0,
+        "usehistory": "y",
+        "mindate": minyear,
+        "maxdate": maxyear
+    }
+    try:
+        # send request to pubmed
+        json_response = await request_eutils(ESEARCH_BASE_URL, params)
+        # change json_response to python object
+        result = json.loads(json_response.content)['esearchresult']
+        history = {
+            "webenv": result['webenv'],
+            "query_key": result['querykey'],
+            "count": int(result['count'])
+        }
+        logger.info(f'Stored {history["count"]} results on history server for words: {words}')
+    except Exception as e:
+        logger.error(f'Error searching history for words: {words}')
+        logger.error(e)
+        return None
+    return history
+
+
+def history_params(history, retstart, retmax):
+    # parameters selecting a page of a history server result set
+    return {
+        "db": "pubmed",
+        "WebEnv": history["webenv"],
+        "query_key": history["query_key"],
+        "retstart": retstart,
+        "retmax": retmax
+    }
+
+
+async def fetch_pmids_from_history(history, retstart, retmax):
+    # Get one page of PMIDs of a history server result set
+    params = dict(history_params(history, retstart, retmax),
+                  rettype="uilist", retmode="text")
+    response = await request_eutils(EFETCH_BASE_URL, params)
+    return response.text.split()
+
+
+async def fetch_paper_abstracts_from_history(history, retstart, retmax):
+    # Get one page of article records (see lib/pubmed_xml.py) of a history
+    # server result set; abstracts are stored in the record cache.
+    records = []
+    async for record in stream_pubmed_articles(history_params(history, retstart, retmax)):
+        records.append(record)
+    await record_cache.set_many("abstract", {r["pmid"]: r["abstract"] for r in records})
+    return records
+
+
+async def fetch_paper_infos_from_history(history, retstart, retmax):
+    # Get one page of paper infos of a history server result set;
+    # they are stored in the record cache.
+    params = dict(history_params(history, retstart, retmax), retmode="json")
+    json_response = await request_eutils(ESUMMARY_BASE_URL, params)
+    result = json.loads(json_response.content)['result']
+    paper_infos = {}
+    for pmid in result.get('uids', []):
+        paper_info = result.get(pmid)
+        if paper_info is None or 'error' in paper_info:
+            continue
+        paper_infos[pmid] = format_paper_info(pmid, paper_info)
+    await record_cache.set_many("summary", paper_infos)
+    return paper_infos
+
+
+async def iter_history_pages(history, fetch_page, page_size=HISTORY_PAGE_SIZE, limit=None):
+    # Yield fetch_page(history, retstart, retmax) for each page of a history
+    # server result set. The next page is requested while the caller is
+    # still working on the current one.
+    total = history["count"] if limit is None else min(limit, history["count"])
+    starts = list(range(0, total, page_size))
+    next_page = None
+    try:
+        for i, start in enumerate(starts):
+            if next_page is None:
+                next_page = asyncio.ensure_future(
+                    fetch_page(history, start, min(page_size, total - start))
+                )
+            page = await next_page
+            next_page = None
+            if i + 1 < len(starts):
+                next_start = starts[i + 1]
+                next_page = asyncio.ensure_future(
+                    fetch_page(history, next_start, min(page_size, total - next_start))
+                )
+            yield page
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+async def iter_pmids_from_words(words, minyear=None, maxyear=None,
+                                page_size=HISTORY_PAGE_SIZE, limit=None):
+    # Yield pages of PMIDs for search words through the history server
+    history = await search_pubmed_history(words, minyear, maxyear)
+    if history is None:
+        return
+    async for pmid_list in iter_history_pages(
+            history, fetch_pmids_from_history, page_size, limit):
+        yield pmid_list
+
+
     
 
+async def _main():
+    try:
+        return await get_paper_abstracts_from_words(["bacteria"], \
+                                              retmax=5, minyear=2020, maxyear=2021)
+    finally:
+        # the loop of asyncio.run ends here
+        await close_client()
+
+
 @measure_performance
 def main():
-    result = asyncio.run(get_paper_abstracts_from_words(["bacteria"], \
-                                              retmax=5, minyear=2020, maxyear=2021))
+    result = asyncio.run(_main())
     print(result)
     # abst = get_paper_abstract(32293474)
     # print(abst)
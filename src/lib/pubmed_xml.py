@@ -0,0 +1,155 @@
+import xml.etree.ElementTree as ET
+
+# top level elements of an EFetch / baseline PubmedArticleSet
+ARTICLE_TAGS = ("PubmedArticle", "PubmedBookArticle", "DeleteCitation")
+
+# month names of the ESummary pubdate field
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun",
+          "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _text(elem):
+    # all text inside elem (titles and abstracts may contain markup)
+    if elem is None:
+        return None
+    text = "".join(elem.itertext()).strip()
+    return text or None
+
+
+def _abstract(article):
+    # join all AbstractText sections, keeping their labels
+    sections = []
+    for section in article.iterfind(".//Abstract/AbstractText"):
+        text = _text(section)
+        if not text:
+            continue
+        label = section.get("Label")
+        sections.append(f"{label}: {text}" if label else text)
+    return "\n".join(sections) if sections else None
+
+
+def _last_author(article):
+    # "LastName Initials" like the ESummary lastauthor field
+    authors = article.findall(".//AuthorList/Author")
+    if not authors:
+        return None
+    author = authors[-1]
+    collective = author.findtext("CollectiveName")
+    if collective:
+        return collective
+    name = " ".join(
+        part for part in (author.findtext("LastName"), author.findtext("Initials")) if part
+    )
+    return name or None
+
+
+def _publication_date(article):
+    # like the ESummary pubdate field: "2020 Apr 15", "2020 Apr", "2020",
+    # or the MedlineDate as given ("1998 Dec-1999 Jan")
+    pub_date = article.find(".//Article/Journal/JournalIssue/PubDate")
+    if pub_date is None:
+        return None
+    year = pub_date.findtext("Year")
+    if year is None:
+        return pub_date.findtext("MedlineDate")
+    month = pub_date.findtext("Month")
+    day = pub_date.findtext("Day")
+    if month is None:
+        return year
+    if month.isdigit() and 1 <= int(month) <= 12:
+        month = MONTHS[int(month) - 1]
+    if day is None:
+        return f"{year} {month}"
+    return f"{year} {month} {int(day) if day.isdigit() else day}"
+
+
+def parse_article(article):
+    """Convert a PubmedArticle element to a record dict.
+
+    Returns:
+        dict: pmid, title, abstract, journal, publication_date, last_author
+    """
+    return {
+        "pmid": article.findtext(".//MedlineCitation/PMID"),
+        "title": _text(article.find(".//Article/ArticleTitle")),
+        "abstract": _abstract(article),
+        "journal": article.findtext(".//Article/Journal/Title"),
+        "publication_date": _publication_date(article),
+        "last_author": _last_author(article),
+    }
+
+
+class PubmedArticleParser:
+    """Incremental parser for PubmedArticleSet XML fed in byte chunks.
+
+    Every completed PubmedArticle is converted to a record and removed
+    from the tree, so memory does not grow with the number of articles.
+    With include_deleted, each PMID of a DeleteCitation (update files)
+    is returned as {"pmid": ..., "deleted": True}.
+
+    Example:
+        parser = PubmedArticleParser()
+        async for chunk in response.aiter_bytes():
+            for record in parser.feed(chunk):
+                ...
+        parser.close()
+    """
+
+    def __init__(self, include_deleted=False):
+        self._parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+        self.include_deleted = include_deleted
+
+    def _records(self):
+        records = []
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+                continue
+            if elem.tag not in ARTICLE_TAGS:
+                continue
+            if elem.tag == "PubmedArticle":
+                records.append(parse_article(elem))
+            elif elem.tag == "DeleteCitation" and self.include_deleted:
+                records.extend({"pmid": pmid.text, "deleted": True}
+                               for pmid in elem.iterfind("PMID"))
+            elem.clear()
+            # drop finished articles from the root element
+            if self._root is not None:
+                self._root.clear()
+        return records
+
+    def feed(self, data):
+        """Feed bytes and return the records completed so far."""
+        self._parser.feed(data)
+        return self._records()
+
+    def close(self):
+        """Finish parsing and return the remaining records."""
+        self._parser.close()
+        return self._records()
+
+
+def iter_pubmed_articles(source, chunk_size=64 * 1024, include_deleted=False):
+    """Yield a record for each PubmedArticle in a file.
+
+    Arguments:
+        source: path or binary file object (e.g. gzip.open(path))
+        chunk_size (int): bytes read at a time
+        include_deleted (bool): also yield DeleteCitation PMIDs
+
+    Yields:
+        dict: see parse_article
+    """
+    if isinstance(source, (str, bytes)) or hasattr(source, "__fspath__"):
+        with open(source, "rb") as f:
+            yield from iter_pubmed_articles(f, chunk_size, include_deleted)
+        return
+    parser = PubmedArticleParser(include_deleted)
+    while True:
+        data = source.read(chunk_size)
+        if not data:
+            break
+        yield from parser.feed(data)
+    yield from parser.close()
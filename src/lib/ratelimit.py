@@ -0,0 +1,125 @@
+import asyncio
+from email.utils import parsedate_to_datetime
+import fcntl
+import json
+import random
+import sys
+import time
+sys.path.append('../')
+from set_log import setup_logger
+from lib.metrics import increment
+
+logger = setup_logger(__name__)
+
+
+class TokenBucket:
+    """Token bucket shared by every process on the host.
+
+    The bucket state (tokens, updated) lives in a small JSON file that is
+    read and written under an exclusive flock, so all gunicorn workers
+    draw from the same budget. Callers reserve tokens up front and sleep
+    until their reservation is covered, which keeps waiting callers in
+    arrival order.
+
+    Arguments:
+        name (string): name used for metrics
+        rate (float): tokens added per second
+        capacity (float): max number of tokens (burst size)
+        state_path (string): path of the shared state file, or None to
+            keep the state in this process only
+    """
+
+    def __init__(self, name, rate, capacity=None, state_path=None):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.state_path = state_path
+        self._local_state = {}
+
+    def _update(self, cost, reserve, hold=0.0):
+        # returns seconds to wait, or None when reserve is False and
+        # there are not enough tokens
+        if self.state_path is None:
+            return self._apply(self._local_state, cost, reserve, hold)
+        try:
+            with open(self.state_path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                raw = f.read()
+                state = json.loads(raw) if raw else {}
+                wait = self._apply(state, cost, reserve, hold)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                return wait
+        except (OSError, ValueError) as e:
+            logger.warning(f'Rate limit state file is not usable: {e}')
+            self.state_path = None
+            return self._apply(self._local_state, cost, reserve, hold)
+
+    def _apply(self, state, cost, reserve, hold=0.0):
+        now = time.time()
+        tokens = state.get("tokens", self.capacity)
+        updated = state.get("updated", now)
+        tokens = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+        if tokens < cost and not reserve:
+            state.update(tokens=tokens, updated=now)
+            return None
+        # a negative cost gives tokens back, up to capacity
+        tokens = min(self.capacity, tokens - cost)
+        if hold > 0:
+            tokens = min(tokens, -hold * self.rate)
+        state.update(tokens=tokens, updated=now)
+        return max(0.0, -tokens / self.rate)
+
+    def reserve(self, cost=1):
+        """Take cost tokens now, going into debt if needed.
+
+        Returns:
+            float: seconds until the reservation is covered
+        """
+        return self._update(cost, reserve=True)
+
+    def release(self, cost):
+        """Give back cost tokens that were reserved but not used."""
+        if cost > 0:
+            self._update(-cost, reserve=True)
+
+    def hold(self, seconds):
+        """Give out no tokens for the next seconds (e.g. after a 429)."""
+        self._update(0, reserve=True, hold=seconds)
+
+    async def acquire(self, cost=1):
+        """Wait until cost tokens are available and take them."""
+        wait = self.reserve(cost)
+        if wait > 0:
+            increment(f"{self.name}.throttled")
+            await asyncio.sleep(wait)
+
+    def try_acquire(self, cost=1):
+        """Take cost tokens if they are available right now.
+
+        Returns:
+            bool: True if the tokens were taken
+        """
+        return self._update(cost, reserve=False) is not None
+
+
+def parse_retry_after(value):
+    """Convert a Retry-After header to seconds (None if missing/invalid)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Exponential backoff with full jitter for the given attempt (0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
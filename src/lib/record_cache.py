@@ -0,0 +1,198 @@
+from datetime import datetime
+import json
+import os
+import sys
+import threading
+sys.path.append('../')
+from set_log import setup_logger
+from flask import current_app, has_app_context
+from sqlalchemy.dialects.postgresql import insert
+from lib.cache import LRUCache, CacheEntry, entry_state
+from lib.metrics import increment
+from lib.aio import spawn
+from lib.singleflight import advisory_lock
+from lib.sessions import run_in_session
+from models import db, PubmedRecord
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+# seconds a cached record is fresh / can still be served while refreshing
+PUBMED_CACHE_TTL = float(os.getenv("PUBMED_CACHE_TTL", str(7 * 24 * 3600)))
+PUBMED_CACHE_STALE_TTL = float(os.getenv("PUBMED_CACHE_STALE_TTL", str(30 * 24 * 3600)))
+# seconds a "no data" result (e.g. PMID without abstract) is cached
+PUBMED_NEGATIVE_CACHE_TTL = float(os.getenv("PUBMED_NEGATIVE_CACHE_TTL", str(24 * 3600)))
+PUBMED_CACHE_SIZE = int(os.getenv("PUBMED_CACHE_SIZE", "4096"))
+
+
+class PubmedRecordCache:
+    """Two level cache of E-utilities results keyed by (kind, pmid).
+
+    Level 1 is an in-process LRU, level 2 is the pubmed_records table.
+    The table is only used inside a Flask app context.
+    """
+
+    def __init__(self, ttl=PUBMED_CACHE_TTL, stale_ttl=PUBMED_CACHE_STALE_TTL,
+                 negative_ttl=PUBMED_NEGATIVE_CACHE_TTL, maxsize=PUBMED_CACHE_SIZE):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.memory = LRUCache("pubmed_cache.memory", maxsize=maxsize,
+                               ttl=ttl, stale_ttl=stale_ttl)
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
+
+    def _ttl_for(self, value):
+        return self.negative_ttl if value is None else self.ttl
+
+    @staticmethod
+    def _read(session, kind, pmids):
+        query = db.select(PubmedRecord).where(
+            PubmedRecord.kind == kind, PubmedRecord.pmid.in_(pmids)
+        )
+        return session.scalars(query).all()
+
+    @staticmethod
+    def _write(session, rows):
+        statement = insert(PubmedRecord).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=["pmid", "kind"],
+            set_={
+                "payload": statement.excluded.payload,
+                "fetched_at": statement.excluded.fetched_at,
+            },
+        )
+        session.execute(statement)
+        session.commit()
+
+    async def get_many(self, kind, pmids):
+        """Return {pmid: CacheEntry} for the cached pmids."""
+        entries = {}
+        for pmid in pmids:
+            entry = self.memory.get((kind, pmid))
+            if entry is not None:
+                entries[pmid] = entry
+        missing = [pmid for pmid in pmids if pmid not in entries]
+        if missing and has_app_context():
+            try:
+                records = await run_in_session(self._read, kind, missing)
+            except Exception as e:
+                logger.warning(f'Error reading pubmed_records: {e}')
+                records = []
+            for record in records:
+                value = json.loads(record.payload)
+                stored_at = record.fetched_at.timestamp()
+                ttl = self._ttl_for(value)
+                state = entry_state(stored_at, ttl, self.stale_ttl)
+                if state is None:
+                    continue
+                self.memory.set((kind, record.pmid), value, ttl=ttl, stored_at=stored_at)
+                entries[record.pmid] = CacheEntry(value, stored_at, state == "stale")
+                increment(f"pubmed_cache.db.{'hit' if state == 'fresh' else 'stale_hit'}")
+        for pmid in pmids:
+            if pmid not in entries:
+                increment(f"pubmed_cache.{kind}.miss")
+            else:
+                increment(f"pubmed_cache.{kind}.hit")
+        return entries
+
+    async def get_expired(self, kind, pmids):
+        """Return {pmid: value} from the table regardless of age.
+
+        Used when fetching failed (e.g. the circuit breaker is open), so
+        an old record is served instead of none.
+        """
+        if not pmids or not has_app_context():
+            return {}
+        try:
+            records = await run_in_session(self._read, kind, pmids)
+        except Exception as e:
+            logger.warning(f'Error reading pubmed_records: {e}')
+            return {}
+        values = {record.pmid: json.loads(record.payload) for record in records}
+        if values:
+            increment(f"pubmed_cache.{kind}.expired_hit", len(values))
+        return values
+
+    async def set_many(self, kind, values):
+        """Store {pmid: value} (None values are cached as negative entries)."""
+        if not values:
+            return
+        now = datetime.now()
+        for pmid, value in values.items():
+            self.memory.set((kind, pmid), value, ttl=self._ttl_for(value),
+                            stored_at=now.timestamp())
+        if not has_app_context():
+            return
+        try:
+            rows = [
+                {"pmid": pmid, "kind": kind, "payload": json.dumps(value), "fetched_at": now}
+                for pmid, value in values.items()
+            ]
+            await run_in_session(self._write, rows)
+        except Exception as e:
+            logger.warning(f'Error writing pubmed_records: {e}')
+
+    async def read_through(self, kind, pmids, fetch):
+        """Return {pmid: value} for pmids, fetching only uncached ones.
+
+        Arguments:
+            kind (string): record kind
+            pmids (list): PMIDs as strings
+            fetch (coroutine function): fetch(pmids) -> {pmid: value}; PMIDs
+                missing from its result (e.g. request failed) are not cached,
+                an expired record is served for them if there is one
+
+        Returns:
+            dict: {pmid: value}, value is None when not available
+        """
+        entries = await self.get_many(kind, pmids)
+        results = {pmid: entry.value for pmid, entry in entries.items()}
+        missing = [pmid for pmid in pmids if pmid not in entries]
+        if missing:
+            # only one worker fetches the same PMIDs at a time; the others
+            # find its results in the table once they get the lock
+            async with advisory_lock(f"pubmed:{kind}:{','.join(sorted(missing))}"):
+                filled = await self.get_many(kind, missing)
+                results.update({pmid: entry.value for pmid, entry in filled.items()})
+                missing = [pmid for pmid in missing if pmid not in filled]
+                if missing:
+                    fetched = await fetch(missing)
+                    await self.set_many(kind, fetched)
+                    results.update(fetched)
+                    failed = [pmid for pmid in missing if pmid not in fetched]
+                    results.update(await self.get_expired(kind, failed))
+        stale = [pmid for pmid, entry in entries.items() if entry.is_stale]
+        if stale:
+            self.refresh_in_background(kind, stale, fetch)
+        return {pmid: results.get(pmid) for pmid in pmids}
+
+    def refresh_in_background(self, kind, pmids, fetch):
+        """Re-fetch stale pmids in a background task on the running loop."""
+        with self._refreshing_lock:
+            pmids = [pmid for pmid in pmids if (kind, pmid) not in self._refreshing]
+            self._refreshing.update((kind, pmid) for pmid in pmids)
+        if not pmids:
+            return
+        increment(f"pubmed_cache.{kind}.refresh", len(pmids))
+        app = current_app._get_current_object() if has_app_context() else None
+        spawn(self._refresh(app, kind, pmids, fetch))
+
+    async def _refresh(self, app, kind, pmids, fetch):
+        try:
+            if app is not None:
+                # own app context (and session), the request's may be gone
+                with app.app_context():
+                    await self.set_many(kind, await fetch(pmids))
+            else:
+                await self.set_many(kind, await fetch(pmids))
+        except Exception as e:
+            logger.warning(f'Error refreshing {kind} for PMIDs {pmids}: {e}')
+        finally:
+            with self._refreshing_lock:
+                self._refreshing.difference_update((kind, pmid) for pmid in pmids)
+
+
+record_cache = PubmedRecordCache()
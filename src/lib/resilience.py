@@ -0,0 +1,201 @@
+import asyncio
+from collections import deque
+import threading
+import time
+import sys
+sys.path.append('../')
+from lib.metrics import increment, set_gauge
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the breaker is open."""
+
+
+class CircuitBreaker:
+    """Error rate based circuit breaker.
+
+    The breaker opens when at least error_rate of the calls in the last
+    window seconds failed (and there were at least min_calls). While open
+    every call is rejected; after reset_timeout seconds one probe call is
+    let through (half open) and its outcome closes or re-opens the breaker.
+
+    State is published as the gauges {name}.state and {name}.error_rate.
+
+    Arguments:
+        name (string): name used for metrics
+        error_rate (float): failure ratio (0-1) that opens the breaker
+        window (float): seconds of calls taken into account
+        min_calls (int): calls needed in the window before it can open
+        reset_timeout (float): seconds to stay open before probing
+    """
+
+    def __init__(self, name, error_rate=0.5, window=30.0, min_calls=10, reset_timeout=30.0):
+        self.name = name
+        self.error_rate = error_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._calls = deque()
+        self._opened_at = None
+        self._probe_started_at = None
+        self._lock = threading.Lock()
+        self._publish(0.0)
+
+    def allow(self):
+        """Return True when a call may be sent now."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN:
+                # one probe at a time; a probe that never reported back
+                # (e.g. cancelled) is replaced after reset_timeout
+                if self._probe_started_at is None \
+                        or now - self._probe_started_at >= self.reset_timeout:
+                    self._probe_started_at = now
+                    return True
+            increment(f"{self.name}.rejected")
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._calls.clear()
+                self._set_state(CLOSED)
+            self._record(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._open()
+                return
+            rate = self._record(False)
+            if self.state == CLOSED and len(self._calls) >= self.min_calls \
+                    and rate >= self.error_rate:
+                self._open()
+
+    def snapshot(self):
+        """Return {"state", "error_rate", "calls"} for monitoring."""
+        with self._lock:
+            self._trim(time.monotonic())
+            return {"state": self.state, "error_rate": self._rate(),
+                    "calls": len(self._calls)}
+
+    def _record(self, ok):
+        now = time.monotonic()
+        self._calls.append((now, ok))
+        self._trim(now)
+        rate = self._rate()
+        self._publish(rate)
+        return rate
+
+    def _trim(self, now):
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    def _rate(self):
+        if not self._calls:
+            return 0.0
+        return sum(1 for _, ok in self._calls if not ok) / len(self._calls)
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._probe_started_at = None
+        self._set_state(OPEN)
+        increment(f"{self.name}.opened")
+
+    def _set_state(self, state):
+        self.state = state
+        if state != HALF_OPEN:
+            self._probe_started_at = None
+        set_gauge(f"{self.name}.state", state)
+
+    def _publish(self, rate):
+        set_gauge(f"{self.name}.state", self.state)
+        set_gauge(f"{self.name}.error_rate", round(rate, 3))
+
+
+class LatencyTracker:
+    """Keep the latest latencies to derive a hedging delay.
+
+    Arguments:
+        size (int): number of latencies kept
+        min_samples (int): samples needed before percentile() answers
+    """
+
+    def __init__(self, size=200, min_samples=20):
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, q):
+        """Return the q-th percentile (0-100), or None without enough samples."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(q / 100 * len(ordered)))
+        return ordered[index]
+
+
+async def hedged(factory, delay, can_hedge, discard=None, name="hedge"):
+    """Await factory(); start a second copy if the first is slower than delay.
+
+    Arguments:
+        factory (callable): returns a coroutine, called once or twice
+        delay (float): seconds to wait before hedging, or None to not hedge
+        can_hedge (callable): returns True when a hedge may be sent now
+            (e.g. there is rate limit budget left)
+        discard (coroutine function): called with the result of a copy
+            that finished but lost, e.g. to close a response
+        name (string): name used for metrics
+
+    Returns:
+        the result of the first copy that succeeded; when every copy
+        failed the exception of the first one is raised
+    """
+    first = asyncio.ensure_future(factory())
+    if delay is None:
+        return await first
+    tasks = [first]
+    winner = None
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not can_hedge():
+            return await first
+
+        increment(f"{name}.sent")
+        tasks.append(asyncio.ensure_future(factory()))
+        pending = set(tasks)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                if task in done and task.exception() is None:
+                    winner = task
+                    break
+    finally:
+        # also runs when the caller is cancelled or times out
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    if winner is None:
+        raise first.exception()
+    if winner is not first:
+        increment(f"{name}.won")
+    # the other copy may have finished in the same step
+    for task in tasks:
+        if task is not winner and task.done() and not task.cancelled() \
+                and task.exception() is None and discard is not None:
+            await discard(task.result())
+    return winner.result()
@@ -0,0 +1,24 @@
+import asyncio
+import sys
+sys.path.append('../')
+from sqlalchemy.orm import Session
+from models import db
+
+
+async def run_in_session(fn, *args):
+    """Run fn(session, *args) with a session of its own, in a thread.
+
+    Cache helpers use it so that they neither commit nor roll back the
+    request's db.session, and so that the database round trip does not
+    block the event loop. Needs an app context (for db.engine).
+
+    Returns:
+        the result of fn; loaded objects stay readable (no expiry on commit)
+    """
+    engine = db.engine
+
+    def run():
+        with Session(engine, expire_on_commit=False) as session:
+            return fn(session, *args)
+
+    return await asyncio.to_thread(run)
@@ -0,0 +1,122 @@
+import asyncio
+from contextlib import asynccontextmanager
+import copy
+from functools import partial
+import hashlib
+import os
+import sys
+sys.path.append('../')
+from set_log import setup_logger
+from flask import has_app_context
+from sqlalchemy import text
+from lib.aio import spawn
+from lib.metrics import increment
+from models import db
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+# also coalesce across workers with Postgres advisory locks
+PUBMED_COALESCE_ACROSS_WORKERS = \
+    os.getenv("PUBMED_COALESCE_ACROSS_WORKERS", "false").lower() == "true"
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key.
+
+    The call runs in its own task, so a caller that is cancelled or
+    times out does not cancel it for the others. Every caller gets its
+    own (deep) copy of the result, so callers may change it.
+
+    Arguments:
+        name (string): name used for metrics
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, fn):
+        """Return a copy of await fn(), sharing the call with concurrent callers of key."""
+        loop = asyncio.get_running_loop()
+        call_key = (loop, key)
+        task = self._calls.get(call_key)
+        if task is None:
+            task = loop.create_task(fn())
+            self._calls[call_key] = task
+            task.add_done_callback(lambda t: self._done(call_key, t))
+            increment(f"{self.name}.calls")
+        else:
+            increment(f"{self.name}.coalesced")
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _done(self, call_key, task):
+        self._calls.pop(call_key, None)
+        # mark the exception as retrieved when every caller went away
+        if not task.cancelled():
+            task.exception()
+
+
+def advisory_lock_id(key):
+    # stable signed 64 bit id for pg_advisory_lock
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def _lock(engine, lock_id):
+    # blocking: returns the connection holding the lock
+    connection = engine.connect()
+    try:
+        connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": lock_id})
+    except Exception:
+        connection.close()
+        raise
+    return connection
+
+
+def _unlock(connection, lock_id):
+    # blocking: the lock belongs to the session, so it must be released
+    # before the connection goes back to the pool
+    try:
+        connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+    finally:
+        connection.close()
+
+
+def _unlock_when_locked(lock_id, future):
+    # a cancelled caller's lock call went on in its thread; release what it took
+    if not future.cancelled() and future.exception() is None:
+        spawn(asyncio.to_thread(_unlock, future.result(), lock_id))
+
+
+@asynccontextmanager
+async def advisory_lock(key):
+    """Hold a Postgres advisory lock on key, shared by all workers.
+
+    Does nothing unless PUBMED_COALESCE_ACROSS_WORKERS is set and there
+    is an app context. The blocking lock calls run in a thread; when the
+    caller is cancelled while waiting, the lock is released as soon as
+    the thread takes it.
+    """
+    if not PUBMED_COALESCE_ACROSS_WORKERS or not has_app_context():
+        yield
+        return
+    lock_id = advisory_lock_id(key)
+    acquire = asyncio.ensure_future(asyncio.to_thread(_lock, db.engine, lock_id))
+    try:
+        connection = await asyncio.shield(acquire)
+    except asyncio.CancelledError:
+        acquire.add_done_callback(partial(_unlock_when_locked, lock_id))
+        raise
+    except Exception as e:
+        logger.warning(f'Could not take advisory lock for {key}: {e}')
+        yield
+        return
+    increment("pubmed_advisory_lock.acquired")
+    try:
+        yield
+    finally:
+        # shielded: a cancelled caller must not keep the lock
+        await asyncio.shield(asyncio.to_thread(_unlock, connection, lock_id))
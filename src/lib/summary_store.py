@@ -0,0 +1,88 @@
+from datetime import datetime
+import sys
+sys.path.append('../')
+from set_log import setup_logger
+from flask import has_app_context
+from sqlalchemy.dialects.postgresql import insert
+from lib.metrics import increment
+from lib.sessions import run_in_session
+from models import db, PaperSummary
+
+logger = setup_logger(__name__)
+
+
+class PaperSummaryStore:
+    """Per-PMID summaries in the paper_summaries table.
+
+    A summary is keyed by (pmid, language, prompt_version, ai_model_id),
+    so it is reused by every user and search until the prompts or the
+    model change. The table is only used inside a Flask app context;
+    get_many and set_many use a session of their own (run_in_session).
+
+    Arguments:
+        prompt_version (string): version (hash) of the summary prompts
+        ai_model_id (string): OpenAI model id
+    """
+
+    def __init__(self, prompt_version, ai_model_id):
+        self.prompt_version = prompt_version
+        self.ai_model_id = ai_model_id
+
+    def _query(self, pmids, language):
+        return db.select(PaperSummary).where(
+            PaperSummary.pmid.in_(pmids),
+            PaperSummary.language == language,
+            PaperSummary.prompt_version == self.prompt_version,
+            PaperSummary.ai_model_id == self.ai_model_id,
+        )
+
+    def rows(self, pmids, language):
+        """Return the stored PaperSummary rows of pmids, in db.session.
+
+        Used by routes and jobs to link a ResultAbstSummary to its sources;
+        errors are left to the caller, which owns the session.
+        """
+        if not pmids or not has_app_context():
+            return []
+        return db.session.scalars(self._query(pmids, language)).all()
+
+    def _read(self, session, pmids, language):
+        return session.execute(
+            self._query(pmids, language).with_only_columns(PaperSummary.pmid, PaperSummary.summary)
+        ).all()
+
+    @staticmethod
+    def _write(session, rows):
+        statement = insert(PaperSummary).values(rows).on_conflict_do_nothing(
+            index_elements=["pmid", "language", "prompt_version", "ai_model_id"]
+        )
+        session.execute(statement)
+        session.commit()
+
+    async def get_many(self, pmids, language):
+        """Return {pmid: summary} for the stored pmids."""
+        if not pmids or not has_app_context():
+            return {}
+        try:
+            summaries = dict(await run_in_session(self._read, pmids, language))
+        except Exception as e:
+            logger.warning(f'Error reading paper_summaries: {e}')
+            summaries = {}
+        increment("summary_store.hit", len(summaries))
+        increment("summary_store.miss", len(pmids) - len(summaries))
+        return summaries
+
+    async def set_many(self, summaries, language):
+        """Store {pmid: summary}; a pmid already stored keeps its summary."""
+        if not summaries or not has_app_context():
+            return
+        now = datetime.now()
+        rows = [
+            {"pmid": pmid, "language": language, "prompt_version": self.prompt_version,
+             "ai_model_id": self.ai_model_id, "summary": summary, "created_at": now}
+            for pmid, summary in summaries.items()
+        ]
+        try:
+            await run_in_session(self._write, rows)
+        except Exception as e:
+            logger.warning(f'Error writing paper_summaries: {e}')
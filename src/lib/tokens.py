@@ -0,0 +1,87 @@
+import re
+import sys
+sys.path.append('../')
+from set_log import setup_logger
+
+logger = setup_logger(__name__)
+
+# context window (prompt + completion tokens) of the OpenAI chat models
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+# tokens added by the chat format around one user message
+MESSAGE_OVERHEAD = 8
+
+_VARIABLE = re.compile(r"\{\{\$(\w+)\}\}")
+_encodings = {}
+_estimate_logged = False
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+def _encoding(ai_model_id):
+    # tiktoken encoding of the model, or None when tiktoken is not installed
+    global _estimate_logged
+    if tiktoken is None:
+        if not _estimate_logged:
+            _estimate_logged = True
+            logger.warning("tiktoken is not installed, estimating token counts "
+                           "(about 4 characters per token)")
+        return None
+    if ai_model_id not in _encodings:
+        try:
+            _encodings[ai_model_id] = tiktoken.encoding_for_model(ai_model_id)
+        except KeyError:
+            _encodings[ai_model_id] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[ai_model_id]
+
+
+def count_tokens(text, ai_model_id="gpt-3.5-turbo"):
+    """Return the number of tokens of text for the model.
+
+    Uses tiktoken when it is installed, otherwise about 4 characters
+    per token.
+    """
+    encoding = _encoding(ai_model_id)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens, ai_model_id="gpt-3.5-turbo"):
+    """Return text cut to at most max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(ai_model_id)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def context_window(ai_model_id):
+    """Return the context window of the model (longest matching prefix)."""
+    matches = [name for name in CONTEXT_WINDOWS if ai_model_id.startswith(name)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def render_prompt(template, variables):
+    """Fill the {{$name}} variables of a semantic-kernel template."""
+    return _VARIABLE.sub(lambda m: str(variables.get(m.group(1), "")), template)
+
+
+def count_prompt_tokens(template, variables, ai_model_id="gpt-3.5-turbo"):
+    """Return the tokens of the rendered prompt, including the chat overhead."""
+    return count_tokens(render_prompt(template, variables), ai_model_id) + MESSAGE_OVERHEAD
@@ -1,9 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import (Boolean, Column, Date, DateTime, Float, ForeignKey,
-                        Integer, BigInteger, String, ARRAY)
+                        Integer, BigInteger, String, ARRAY, UniqueConstraint)
 import os
+import json
 from datetime import datetime
-import semantic_kernel as sk
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -257,7 +257,7 @@ class ResultAbstTranslation(db.Model):
 
 # --------------------------------------------------------------------------- #
 # ResultAbstSummary
-# Have id, paper_id, summary, created_at
+# Have id, paper_id, summary, created_at, paper_summaries (its sources)
 # --------------------------------------------------------------------------- #
 class ResultAbstSummary(db.Model):
     __tablename__ = 'results_abst_summary'
@@ -267,6 +267,10 @@ class ResultAbstSummary(db.Model):
     abst_summary = Column(String, nullable=False)
     language = Column(String, nullable=False)
     created_at = Column(Date, nullable=False)
+    paper_summaries = db.relationship(
+        'PaperSummary', secondary='results_abst_summary_sources',
+        order_by='PaperSummary.pmid'
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -300,6 +304,77 @@ class ResultAbstSummary(db.Model):
             'id': self.id,
             'abst_summary': self.abst_summary,
             'language': self.language,
+            'pmids': [paper_summary.pmid for paper_summary in self.paper_summaries],
+            'paper_summaries': [
+                paper_summary.format() for paper_summary in self.paper_summaries
+            ],
+            'created_at': self.created_at
+        }
+
+
+# --------------------------------------------------------------------------- #
+# PaperSummary
+# Summary of one abstract, shared by every user and search
+# Have id, pmid, language, prompt_version, ai_model_id, summary, created_at
+# --------------------------------------------------------------------------- #
+results_abst_summary_sources = db.Table(
+    'results_abst_summary_sources',
+    Column('result_abst_summary_id', Integer,
+           ForeignKey('results_abst_summary.id', ondelete='CASCADE'), primary_key=True),
+    Column('paper_summary_id', Integer,
+           ForeignKey('paper_summaries.id', ondelete='CASCADE'), primary_key=True),
+)
+
+
+class PaperSummary(db.Model):
+    __tablename__ = 'paper_summaries'
+    __table_args__ = (UniqueConstraint('pmid', 'language', 'prompt_version', 'ai_model_id'),)
+
+    id = Column(Integer, primary_key=True)
+    pmid = Column(String, nullable=False)
+    language = Column(String, nullable=False)
+    # hash of the summary prompts (see summarize.SUMMARY_PROMPT_VERSION)
+    prompt_version = Column(String, nullable=False)
+    ai_model_id = Column(String, nullable=False)
+    summary = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.init_on_load()
+
+    def init_on_load(self):
+        if self.created_at is None:
+            self.created_at = datetime.now()
+
+    def __repr__(self):
+        return f'<PaperSummary {self.pmid} {self.language} {self.prompt_version}>'
+
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
+    def rollback(self):
+        db.session.rollback()
+
+    def close_session(self):
+        db.session.close()
+
+    def format(self):
+        return {
+            'id': self.id,
+            'pmid': self.pmid,
+            'language': self.language,
+            'prompt_version': self.prompt_version,
+            'ai_model_id': self.ai_model_id,
+            'summary': self.summary,
             'created_at': self.created_at
         }
 
@@ -354,14 +429,259 @@ class ResultPaperSummary(db.Model):
             'created_at': self.created_at
         }
 
+
+# --------------------------------------------------------------------------- #
+# PubmedCatalog
+# Local copy of PubMed loaded from baseline/update dumps (see ingest_pubmed.py)
+# Have pmid, title, last_author, publication_date, abstract, deleted,
+# file_number, loaded_at
+# --------------------------------------------------------------------------- #
+class PubmedCatalog(db.Model):
+    __tablename__ = 'pubmed_catalog'
+
+    pmid = Column(String, primary_key=True)
+    title = Column(String)
+    last_author = Column(String)
+    publication_date = Column(String)
+    abstract = Column(String)
+    # deleted by an update file
+    deleted = Column(Boolean, nullable=False, default=False)
+    # number of the dump file (pubmed24nXXXX) the row was loaded from
+    file_number = Column(Integer, nullable=False)
+    loaded_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return f'<PubmedCatalog {self.pmid} {self.title}>'
+
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
+    def rollback(self):
+        db.session.rollback()
+
+    def close_session(self):
+        db.session.close()
+
+    def format(self):
+        return {
+            'pmid': self.pmid,
+            'title': self.title,
+            'last_author': self.last_author,
+            'publication_date': self.publication_date,
+            'abstract': self.abstract,
+            'deleted': self.deleted,
+            'file_number': self.file_number,
+            'loaded_at': self.loaded_at
+        }
+
+
+# --------------------------------------------------------------------------- #
+# PubmedRecord
+# Cached E-utilities result for one PMID
+# Have id, pmid, kind ("summary" or "abstract"), payload (JSON), fetched_at
+# --------------------------------------------------------------------------- #
+class PubmedRecord(db.Model):
+    __tablename__ = 'pubmed_records'
+    __table_args__ = (UniqueConstraint('pmid', 'kind'),)
+
+    id = Column(Integer, primary_key=True)
+    pmid = Column(String, nullable=False)
+    kind = Column(String, nullable=False)
+    # JSON encoded value, "null" when PubMed has no data (negative cache)
+    payload = Column(String, nullable=False)
+    fetched_at = Column(DateTime, nullable=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.init_on_load()
+
+    def init_on_load(self):
+        if self.fetched_at is None:
+            self.fetched_at = datetime.now()
+
+    def __repr__(self):
+        return f'<PubmedRecord {self.pmid} {self.kind}>'
+
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
+    def rollback(self):
+        db.session.rollback()
+
+    def close_session(self):
+        db.session.close()
+
+    def format(self):
+        return {
+            'id': self.id,
+            'pmid': self.pmid,
+            'kind': self.kind,
+            'payload': self.payload,
+            'fetched_at': self.fetched_at
+        }
+
+
+# --------------------------------------------------------------------------- #
+# LLMResponse
+# Cached LLM response (see lib/llm_cache.py)
+# Have id, key (sha256 of prompt, variables, model id and settings),
+# module_name, response, created_at
+# --------------------------------------------------------------------------- #
+class LLMResponse(db.Model):
+    __tablename__ = 'llm_responses'
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String(64), nullable=False, unique=True)
+    module_name = Column(String, nullable=False)
+    response = Column(String, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.init_on_load()
+
+    def init_on_load(self):
+        if self.created_at is None:
+            self.created_at = datetime.now()
+
+    def __repr__(self):
+        return f'<LLMResponse {self.module_name} {self.key}>'
+
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
+    def rollback(self):
+        db.session.rollback()
+
+    def close_session(self):
+        db.session.close()
+
+    def format(self):
+        return {
+            'id': self.id,
+            'key': self.key,
+            'module_name': self.module_name,
+            'response': self.response,
+            'created_at': self.created_at
+        }
+
+# --------------------------------------------------------------------------- #
+# Job
+# Background job (see jobs.py)
+# Have id, job_type, payload (JSON), status, attempts, max_attempts,
+# result (JSON), error, run_at, locked_until, locked_by, created_at, updated_at
+# --------------------------------------------------------------------------- #
+class Job(db.Model):
+    __tablename__ = 'jobs'
+
+    id = Column(Integer, primary_key=True)
+    job_type = Column(String, nullable=False, index=True)
+    payload = Column(String, nullable=False)
+    # "queued", "running", "done" or "failed"
+    status = Column(String, nullable=False, index=True)
+    attempts = Column(Integer, nullable=False)
+    max_attempts = Column(Integer, nullable=False)
+    result = Column(String)
+    error = Column(String)
+    # not run before run_at (retry backoff)
+    run_at = Column(DateTime, nullable=False)
+    # a running job whose lock expired is picked up again (visibility timeout)
+    locked_until = Column(DateTime)
+    locked_by = Column(String)
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.init_on_load()
+
+    def init_on_load(self):
+        now = datetime.now()
+        if self.status is None:
+            self.status = "queued"
+        if self.attempts is None:
+            self.attempts = 0
+        if self.run_at is None:
+            self.run_at = now
+        if self.created_at is None:
+            self.created_at = now
+        if self.updated_at is None:
+            self.updated_at = now
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.job_type} {self.status}>'
+
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+
+    def update(self):
+        self.updated_at = datetime.now()
+        db.session.commit()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+
+    def rollback(self):
+        db.session.rollback()
+
+    def close_session(self):
+        db.session.close()
+
+    def format(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'attempts': self.attempts,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
 class AIModel:
-    def __init__(self, model_name, function, kernel, context=None):
+    def __init__(self, model_name, function, kernel, context=None, fingerprint=None,
+                 prompt=None, ai_model_id=None, execution_settings=None):
         self.role = model_name
         self.kernel = kernel  # kernelをプロパティとして追加
         self.function = function  # chat_function
         self.history = context  # チャットの履歴を格納
+        # prompt template, model id and settings (see lib/llm_cache.py)
+        self.fingerprint = fingerprint
+        # used to count prompt tokens and to override max_tokens per call
+        self.prompt = prompt
+        self.ai_model_id = ai_model_id
+        self.execution_settings = execution_settings
+
+    async def invoke(self, context_variables=None, max_tokens=None):
+        import semantic_kernel as sk
 
-    async def invoke(self, context_variables=None):
         if context_variables is None:
             language = "japanese"
             abstract = "None"
@@ -372,7 +692,11 @@ class AIModel:
             abstract_list = context_variables.get(
                 "abstract_list", "abstract_list"
             )
+        settings = None
+        if max_tokens is not None and self.execution_settings is not None:
+            settings = self.execution_settings.model_copy(update={"max_tokens": max_tokens})
         arguments = sk.KernelArguments(
+            settings=settings,
             language=language,
             abstract=abstract,
             abstract_list=abstract_list,
@@ -1,2 +1,3 @@
 from .abst_sum import ABST_SUM
-from .abst_sum_final import ABST_SUM_FINAL
\ No newline at end of file
+from .abst_sum_final import ABST_SUM_FINAL
+from .abst_sum_batch import ABST_SUM_BATCH
\ No newline at end of file
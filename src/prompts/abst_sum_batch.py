@@ -0,0 +1,28 @@
+ABST_SUM_BATCH = """
+You are a brilliant scientst.
+Return a JSON file containing a concise summary of each abstract based on the following constraints, instructions, abstract list, and format.
+
+-- Begin CONSTRAINTS --
+JSON file must be written in this language: {{$language}}
+In addition, you must also summarize each abstract in about 100 words.
+Return exactly one summary for each abstract, with the PMID of the abstract.
+-- End CONSTRAINTS --
+
+-- Begin INSTRUCTIONS --
+Please summarize each abstract of the abstract list separately and as clearly as possible.
+Each abstract starts with a line "PMID: <pmid>".
+-- End INSTRUCTIONS --
+
+-- Begin ABSTRACT LIST --\n {{$abstract_list}} -- End ABSTRACT LIST --\n
+
+-- FORMAT -- Please return the json file according to the following format.
+{
+    "summaries": [
+        {
+            "pmid": <string>,
+            "summary": <string>
+        }
+    ]
+}
+
+"""
\ No newline at end of file
@@ -1,33 +1,61 @@
-import semantic_kernel as sk
-import semantic_kernel.connectors.ai.open_ai as sk_oai
-from semantic_kernel.prompt_template.input_variable import InputVariable
 from models import AIModel
 from set_log import setup_logger
+from lib.llm_cache import llm_cache, prompt_fingerprint, response_key, LLM_CACHE_ENABLED
+from lib.metrics import increment
+from lib.openai_limit import openai_limiter, call_with_limits
+from lib.tokens import (count_tokens, count_prompt_tokens, truncate_tokens,
+                        context_window)
 import asyncio
+from functools import partial
 import os
 import sys
 import json
+import threading
+import time
 from prompts.abst_sum import ABST_SUM
 from prompts.abst_sum_final import ABST_SUM_FINAL
+from prompts.abst_sum_batch import ABST_SUM_BATCH
 from dotenv import load_dotenv
 
 load_dotenv()
 
 MAX_API_TIMEOUT = 120
+OPENAI_MODEL_ID = os.getenv("OPENAI_MODEL_ID", "gpt-3.5-turbo")
+# can point to a local stand-in server (see bench/fake_openai.py)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+
+# expected completion tokens, used as max_tokens of a call
+# (about 100 words per summary, 200 for the combined one, plus the JSON)
+EXPECTED_OUTPUT_TOKENS = {
+    "abst_sum": 300,
+    "abst_sum_final": 600,
+}
+# per abstract of an abst_sum_batch call
+EXPECTED_OUTPUT_TOKENS_PER_ABSTRACT = 250
+# context tokens left free for differences between local and API counts
+CONTEXT_MARGIN = 32
 
 def initialize_kernel(
         api_key,
         api_key_type="openai",
         ai_model_id="gpt-3.5-turbo",
         org_id=None,
+        base_url=None,
 ):
+    # semantic_kernel is slow to import, it is only loaded when needed
+    import semantic_kernel as sk
+    import semantic_kernel.connectors.ai.open_ai as sk_oai
+    from openai import AsyncOpenAI
+
     kernel = sk.Kernel()
     if api_key_type == "openai":
+        # retries are done by call_with_limits, under the rate limiter
+        client = AsyncOpenAI(api_key=api_key, organization=org_id, base_url=base_url,
+                             max_retries=0)
         kernel.add_service(
             sk_oai.OpenAIChatCompletion(
                 ai_model_id=ai_model_id,
-                api_key=api_key,
-                org_id=org_id,
+                async_client=client,
             ),
         )
     return kernel
@@ -36,12 +64,17 @@ def create_ai_model(
     kernel,
     model_name,
     prompt,
+    ai_model_id=OPENAI_MODEL_ID,
     max_tokens=1500,
     temperature=0.5,
     top_p=0.5,
     frequency_penalty=0.0,
     presence_penalty=0.0,
 ):
+    import semantic_kernel as sk
+    import semantic_kernel.connectors.ai.open_ai as sk_oai
+    from semantic_kernel.prompt_template.input_variable import InputVariable
+
     if not prompt:
         raise ValueError("Prompt cannot be empty")
     execution_settings = sk_oai.OpenAIChatPromptExecutionSettings(
@@ -77,14 +110,59 @@ def create_ai_model(
             prompt_template_config=prompt_template_config,
         ),
         kernel,
+        fingerprint=prompt_fingerprint(prompt, ai_model_id, execution_settings),
+        prompt=prompt,
+        ai_model_id=ai_model_id,
+        execution_settings=execution_settings,
     )
     return model
 
 
-async def run_semantic_function(model, context_variables=None):
+def expected_output_tokens(module_name, context_variables):
+    if module_name == "abst_sum_batch":
+        n_abstracts = context_variables.get("abstract_list", "").count("PMID: ")
+        return EXPECTED_OUTPUT_TOKENS_PER_ABSTRACT * max(1, n_abstracts)
+    return EXPECTED_OUTPUT_TOKENS.get(module_name, 1500)
+
+
+def fit_to_context(model, module_name, context_variables):
+    """Fit a call into the context window of the model.
+
+    max_tokens is set to the expected output size; when the prompt plus
+    that does not fit, the abstract (or abstract list) is trimmed.
 
-    response = await asyncio.wait_for(
-        model.invoke(context_variables=context_variables),
+    Returns:
+        tuple: (context variables, prompt tokens, max_tokens)
+    """
+    max_tokens = expected_output_tokens(module_name, context_variables)
+    window = context_window(model.ai_model_id) - CONTEXT_MARGIN
+    prompt_tokens = count_prompt_tokens(model.prompt, context_variables, model.ai_model_id)
+    excess = prompt_tokens + max_tokens - window
+    if excess > 0:
+        name = "abstract_list" if "abstract_list" in context_variables else "abstract"
+        text = context_variables.get(name, "")
+        keep = count_tokens(text, model.ai_model_id) - excess
+        logger.warning(f'{module_name} prompt has {prompt_tokens} tokens, '
+                       f'trimming {name} by {excess} tokens')
+        increment(f"llm.{module_name}.trimmed")
+        context_variables = dict(
+            context_variables, **{name: truncate_tokens(text, keep, model.ai_model_id)}
+        )
+        prompt_tokens = count_prompt_tokens(model.prompt, context_variables, model.ai_model_id)
+    return context_variables, prompt_tokens, max_tokens
+
+
+async def run_semantic_function(model, context_variables=None, max_tokens=None,
+                                prompt_tokens=None):
+    # the call reserves prompt_tokens + max_tokens from the OpenAI limiter
+    if prompt_tokens is None:
+        prompt_tokens = count_prompt_tokens(model.prompt, context_variables or {},
+                                            model.ai_model_id)
+    if max_tokens is None:
+        max_tokens = model.execution_settings.max_tokens or 0
+    response = await call_with_limits(
+        partial(model.invoke, context_variables=context_variables, max_tokens=max_tokens),
+        prompt_tokens + max_tokens,
         timeout=MAX_API_TIMEOUT,
     )
     return response
@@ -94,31 +172,82 @@ logger = setup_logger(__name__)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-kernel = initialize_kernel(api_key=OPENAI_API_KEY)
+# arguments of create_ai_model for each module; the kernel and the models
+# are created on first use (get_ai_model), not at import
+AI_MODULES = {
+    "abst_sum": {"prompt": ABST_SUM},
+    "abst_sum_final": {"prompt": ABST_SUM_FINAL},
+    # several abstracts per call; room for about 10 summaries
+    "abst_sum_batch": {"prompt": ABST_SUM_BATCH, "max_tokens": 2500},
+}
 
-try:
-    logger.info("Starting LLM modeules...")
-    abst_sum_model = create_ai_model(
-        kernel=kernel,
-        model_name="abst_sum",
-        prompt=ABST_SUM,
-    )
-    abst_sum_final_model = create_ai_model(
-        kernel=kernel,
-        model_name="abst_sum_final",
-        prompt=ABST_SUM_FINAL,
-    )
-except Exception as e:
-    logger.error("Error", e)
+_kernel = None
+_ai_models = {}
+_init_lock = threading.Lock()
 
-async def get_module_response(module_name, context_variables):
-    if module_name == "abst_sum":
-        model = abst_sum_model
-    elif module_name == "abst_sum_final":
-        model = abst_sum_final_model
-    if model is None:
+
+def get_kernel():
+    global _kernel
+    with _init_lock:
+        if _kernel is None:
+            _kernel = initialize_kernel(api_key=OPENAI_API_KEY, ai_model_id=OPENAI_MODEL_ID,
+                                        base_url=OPENAI_BASE_URL)
+        return _kernel
+
+
+def get_ai_model(module_name):
+    if module_name not in AI_MODULES:
         raise ValueError(f'Invalid module name: {module_name}')
-    response = asyncio.run(run_semantic_function(model, context_variables))
+    model = _ai_models.get(module_name)
+    if model is None:
+        kernel = get_kernel()
+        with _init_lock:
+            model = _ai_models.get(module_name)
+            if model is None:
+                logger.info(f"Starting LLM module {module_name}...")
+                model = create_ai_model(
+                    kernel=kernel,
+                    model_name=module_name,
+                    **AI_MODULES[module_name],
+                )
+                _ai_models[module_name] = model
+    return model
+
+
+async def get_module_response(module_name, context_variables):
+    model = get_ai_model(module_name)
+
+    # identical prompt, variables, model and settings give the cached response
+    key = response_key(model.fingerprint, context_variables) if LLM_CACHE_ENABLED else None
+    if key is not None:
+        response = await llm_cache.get(key)
+        if response is not None:
+            return response
+
+    context_variables, prompt_tokens, max_tokens = \
+        fit_to_context(model, module_name, context_variables)
+    start = time.perf_counter()
+    response = await run_semantic_function(model, context_variables, max_tokens, prompt_tokens)
+    elapsed = time.perf_counter() - start
+
+    # token counts per call, to track cost and latency against input size
+    completion_tokens = count_tokens(response, model.ai_model_id)
+    openai_limiter.release(max_tokens - completion_tokens)
+    increment(f"llm.{module_name}.calls")
+    increment(f"llm.{module_name}.prompt_tokens", prompt_tokens)
+    increment(f"llm.{module_name}.completion_tokens", completion_tokens)
+    logger.info(f'{module_name}: {prompt_tokens} prompt tokens, '
+                f'{completion_tokens} completion tokens (max_tokens {max_tokens}), '
+                f'{elapsed:.2f} sec')
+
+    # only well formed (JSON) responses are cached
+    if key is not None:
+        try:
+            json.loads(response)
+        except ValueError:
+            logger.warning(f'Not caching malformed {module_name} response')
+        else:
+            await llm_cache.set(key, module_name, response)
     return response
 
 
@@ -127,7 +256,7 @@ if __name__ == "__main__":
         "language": "en",
         "abstract": "Neutrophil chemotaxis plays a vital role in human immune system. Compared with traditional cell migration assays, the emergence of microfluidics provides a new research platform of cell chemotaxis study due to the advantages of visualization, precise control of chemical gradient, and small consumption of reagents. ",
     }
-    response = get_module_response("abst_sum", context_variables=context_variables)
+    response = asyncio.run(get_module_response("abst_sum", context_variables=context_variables))
     print(response)
     json_response = json.loads(response)
     print(json_response["summary"])
@@ -0,0 +1,345 @@
+import hashlib
+import json
+import os
+from functools import partial
+from skills import get_module_response, OPENAI_MODEL_ID
+from set_log import setup_logger
+from prompts.abst_sum import ABST_SUM
+from prompts.abst_sum_batch import ABST_SUM_BATCH
+from lib import get_pmids_from_words, get_paper_abstracts
+from lib.aio import gather_bounded
+from lib.summary_store import PaperSummaryStore
+from lib.tokens import count_tokens
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = setup_logger(__name__)
+
+# max number of concurrent LLM calls per request
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "5"))
+# optional overall timeout of each LLM call, including its wait in the
+# OpenAI limiter and its retries; each attempt is already bounded by
+# MAX_API_TIMEOUT (skills.run_semantic_function)
+SUMMARY_TIMEOUT = float(os.getenv("SUMMARY_TIMEOUT")) if os.getenv("SUMMARY_TIMEOUT") else None
+
+# pack several abstracts into one abst_sum_batch call
+SUMMARY_PACKING = os.getenv("SUMMARY_PACKING", "true").lower() == "true"
+# max input tokens of abstracts in one packed call
+SUMMARY_PACK_TOKENS = int(os.getenv("SUMMARY_PACK_TOKENS", "6000"))
+# max abstracts in one packed call (bounded by abst_sum_batch max_tokens)
+SUMMARY_PACK_SIZE = int(os.getenv("SUMMARY_PACK_SIZE", "10"))
+# max number of papers summarized for one search
+SUMMARY_MAX_PAPERS = int(os.getenv("SUMMARY_MAX_PAPERS", "500"))
+# max input tokens of summaries combined in one abst_sum_final call
+SUMMARY_REDUCE_TOKENS = int(os.getenv("SUMMARY_REDUCE_TOKENS", "3000"))
+# max number of abst_sum_final levels (each one at least halves the summaries)
+SUMMARY_REDUCE_MAX_LEVELS = int(os.getenv("SUMMARY_REDUCE_MAX_LEVELS", "12"))
+# stored per-abstract summaries are reused while the prompts are unchanged
+SUMMARY_PROMPT_VERSION = os.getenv("SUMMARY_PROMPT_VERSION") or \
+    hashlib.sha256((ABST_SUM + ABST_SUM_BATCH).encode()).hexdigest()[:12]
+
+summary_store = PaperSummaryStore(SUMMARY_PROMPT_VERSION, OPENAI_MODEL_ID)
+
+
+def pack_abstracts(abstracts, max_tokens=SUMMARY_PACK_TOKENS, max_size=SUMMARY_PACK_SIZE):
+    """Split {pmid: abstract} into packs that fit in one call.
+
+    Abstracts are packed in order; one that does not fit the budget on
+    its own gets a pack of its own.
+
+    Returns:
+        list: lists of pmids
+    """
+    packs = []
+    pack = []
+    pack_tokens = 0
+    for pmid, abstract in abstracts.items():
+        tokens = count_tokens(abstract, OPENAI_MODEL_ID)
+        if pack and (pack_tokens + tokens > max_tokens or len(pack) >= max_size):
+            packs.append(pack)
+            pack = []
+            pack_tokens = 0
+        pack.append(pmid)
+        pack_tokens += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def format_abstract_list(abstracts, pmids):
+    # abstract list of a packed call, one "PMID: <pmid>" header per abstract
+    return "\n\n".join(f"PMID: {pmid}\n{abstracts[pmid]}" for pmid in pmids)
+
+
+async def summarize_abstract(abstract, language="English"):
+    # summarize one abstract with the abst_sum model
+    content_variables = {
+        "language": language,
+        "abstract": abstract
+    }
+    json_response = await get_module_response("abst_sum", content_variables)
+    return json.loads(json_response)["summary"]
+
+
+async def summarize_pack(abstracts, pmids, language="English"):
+    # summarize several abstracts with one abst_sum_batch call;
+    # returns {pmid: summary} for the summaries that came back valid
+    content_variables = {
+        "language": language,
+        "abstract_list": format_abstract_list(abstracts, pmids)
+    }
+    json_response = await get_module_response("abst_sum_batch", content_variables)
+    summaries = json.loads(json_response)["summaries"]
+    if len(summaries) != len(pmids):
+        logger.warning(f"Expected {len(pmids)} summaries, got {len(summaries)}.")
+    results = {}
+    for item in summaries:
+        pmid = str(item.get("pmid", "")).strip()
+        summary = item.get("summary")
+        if pmid in pmids and isinstance(summary, str) and summary:
+            results[pmid] = summary
+    return results
+
+
+async def summarize_abstracts(abstracts, language="English", packing=SUMMARY_PACKING,
+                              concurrency=SUMMARY_CONCURRENCY, timeout=SUMMARY_TIMEOUT,
+                              on_summary=None):
+    """Summarize each abstract, concurrently.
+
+    Stored summaries (summary_store) are reused and new ones are stored.
+
+    With packing, abstracts are summarized several at a time with the
+    abst_sum_batch model; anything missing from a packed answer falls
+    back to a single abst_sum call.
+
+    Arguments:
+        abstracts (dict): {pmid: abstract}
+        language (string): response language
+        packing (bool): pack several abstracts per call
+        concurrency (int): max number of calls running at once
+        timeout (float): seconds each call may take, queueing in the
+            OpenAI limiter included, or None (SUMMARY_TIMEOUT)
+        on_summary (callable): called with (pmid, summary) as soon as a
+            summary is available
+
+    Returns:
+        dict: {pmid: summary} in input order; summary is None where it failed
+    """
+    total = len(abstracts)
+    summaries = {}
+
+    def add(pmid, summary):
+        summaries[pmid] = summary
+        if on_summary is not None:
+            on_summary(pmid, summary)
+
+    async def summarize_packed(pack):
+        result = await summarize_pack(abstracts, pack, language)
+        for pmid, summary in result.items():
+            add(pmid, summary)
+        logger.info(f"Summarized {len(result)} abstracts in one call "
+                    f"({len(summaries)} of {total} done).")
+        return result
+
+    # summaries made before, for any user or search
+    for pmid, summary in (await summary_store.get_many(list(abstracts), language)).items():
+        add(pmid, summary)
+    if summaries:
+        logger.info(f"Reusing {len(summaries)} of {total} stored summaries.")
+    pending = {pmid: abstract for pmid, abstract in abstracts.items() if pmid not in summaries}
+
+    if packing:
+        packs = [pack for pack in pack_abstracts(pending) if len(pack) > 1]
+        results = await gather_bounded(
+            [partial(summarize_packed, pack) for pack in packs], concurrency, timeout
+        )
+        for pack, result in zip(packs, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Error summarizing abstracts {pack}: {result!r}")
+
+    missing = [pmid for pmid in abstracts if pmid not in summaries]
+
+    async def summarize(pmid):
+        summary = await summarize_abstract(abstracts[pmid], language)
+        add(pmid, summary)
+        logger.info(f"Summarized abstract {pmid} ({len(summaries)} of {total} done).")
+        return summary
+
+    results = await gather_bounded(
+        [partial(summarize, pmid) for pmid in missing], concurrency, timeout
+    )
+    for pmid, result in zip(missing, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Error summarizing abstract {pmid}: {result!r}")
+
+    await summary_store.set_many(
+        {pmid: summaries[pmid] for pmid in pending if summaries.get(pmid)}, language
+    )
+    return {pmid: summaries.get(pmid) for pmid in abstracts}
+
+
+def source_summaries(summaries, language="English"):
+    """Return the stored PaperSummary rows of {pmid: summary or None}.
+
+    Used to link a ResultAbstSummary to the summaries it was built from
+    (summarize_search makes them in English).
+    """
+    pmids = [pmid for pmid, summary in summaries.items() if summary is not None]
+    return summary_store.rows(pmids, language)
+
+
+def group_summaries(summaries, max_tokens=SUMMARY_REDUCE_TOKENS):
+    """Split summaries into groups combined by one abst_sum_final call.
+
+    Every group (but a lone last one) has at least two summaries, so
+    each level at least halves their number and the depth stays
+    logarithmic.
+
+    Returns:
+        list: lists of summaries
+    """
+    groups = []
+    group = []
+    group_tokens = 0
+    last_tokens = 0
+    for summary in summaries:
+        tokens = count_tokens(summary, OPENAI_MODEL_ID)
+        if len(group) >= 2 and group_tokens + tokens > max_tokens:
+            groups.append(group)
+            last_tokens = group_tokens
+            group = []
+            group_tokens = 0
+        group.append(summary)
+        group_tokens += tokens
+    if group:
+        # a lone summary is merged into the previous group if it fits
+        if len(group) == 1 and groups and last_tokens + group_tokens <= max_tokens:
+            groups[-1].extend(group)
+        else:
+            groups.append(group)
+    return groups
+
+
+async def combine_summaries(summaries, language="English"):
+    # combine summaries into one with the abst_sum_final model
+    content_variables = {
+        "language": language,
+        "abstract_list": "\n\n".join(summaries)
+    }
+    json_response = await get_module_response("abst_sum_final", content_variables)
+    return json.loads(json_response)["summary"]
+
+
+async def reduce_summaries(summaries, language="English", max_tokens=SUMMARY_REDUCE_TOKENS,
+                           concurrency=SUMMARY_CONCURRENCY, timeout=SUMMARY_TIMEOUT,
+                           max_levels=SUMMARY_REDUCE_MAX_LEVELS):
+    """Combine summaries level by level until one summary remains.
+
+    Each level combines token-bounded groups concurrently. A group of
+    one summary, and a group that fails, is carried over to the next
+    level as it is; a single summary is only sent to the LLM when it is
+    the whole input, to get it in the response language. RuntimeError
+    is raised when a level does not reduce the number of summaries or
+    after max_levels levels.
+
+    Arguments:
+        summaries (list): summaries to combine
+        language (string): response language
+        max_tokens (int): max input tokens per call
+        max_levels (int): max number of levels
+
+    Returns:
+        string: the combined summary
+    """
+    if not summaries:
+        raise ValueError("No summaries to combine")
+    depth = 0
+    while True:
+        if depth >= max_levels:
+            raise RuntimeError(f"Could not combine {len(summaries)} summaries "
+                               f"in {max_levels} levels")
+        groups = group_summaries(summaries, max_tokens)
+        calls = [group for group in groups if len(group) > 1 or len(summaries) == 1]
+        results = iter(await gather_bounded(
+            [partial(combine_summaries, group, language) for group in calls],
+            concurrency, timeout
+        ))
+        depth += 1
+        combined = []
+        failed = 0
+        for group in groups:
+            if len(group) == 1 and len(summaries) > 1:
+                # a lone summary is combined at a later level
+                combined.extend(group)
+                continue
+            result = next(results)
+            if isinstance(result, BaseException):
+                logger.error(f"Error combining {len(group)} summaries: {result!r}")
+                combined.extend(group)
+                failed += 1
+            else:
+                combined.append(result)
+        if failed == len(calls):
+            raise RuntimeError(f"Could not combine summaries at level {depth}")
+        logger.info(f"Combined {len(summaries)} summaries into {len(combined)} "
+                    f"(level {depth}).")
+        if len(combined) == 1:
+            return combined[0]
+        if len(combined) >= len(summaries):
+            raise RuntimeError(f"Could not reduce {len(summaries)} summaries "
+                               f"at level {depth}")
+        summaries = combined
+
+
+async def summarize_search(abstracts, language="English", on_summary=None):
+    """Map-reduce summary of the abstracts of a search.
+
+    The map step summarizes each abstract (summarize_abstracts), the
+    reduce step combines the summaries (reduce_summaries).
+
+    Arguments:
+        abstracts (dict): {pmid: abstract}
+        language (string): language of the combined summary
+        on_summary (callable): see summarize_abstracts
+
+    Returns:
+        tuple: (combined summary, {pmid: summary or None})
+    """
+    summaries = await summarize_abstracts(abstracts, on_summary=on_summary)
+    available = [summary for summary in summaries.values() if summary is not None]
+    return await reduce_summaries(available, language), summaries
+
+
+async def summarize_words(search_words, language="English", retmax=5, on_event=None):
+    """Search PubMed and summarize the abstracts found.
+
+    Arguments:
+        search_words (list): search words
+        language (string): language of the combined summary
+        retmax (int): max number of papers
+        on_event (callable): called with (event, data) as work completes:
+            "pmids" {"pmids"}, "abstract" {"pmid", "available"},
+            "summary" {"pmid", "summary"}
+
+    Returns:
+        tuple: (combined summary, {pmid: summary or None}), or None when
+            nothing was found
+    """
+    def emit(event, **data):
+        if on_event is not None:
+            on_event(event, data)
+
+    pmid_list = await get_pmids_from_words(words=search_words, retmax=retmax)
+    if not pmid_list:
+        return None
+    emit("pmids", pmids=pmid_list)
+    abstracts = await get_paper_abstracts(pmid_list)
+    for pmid, abstract in abstracts.items():
+        emit("abstract", pmid=pmid, available=bool(abstract))
+    abstracts = {pmid: abstract for pmid, abstract in abstracts.items() if abstract}
+
+    def on_summary(pmid, summary):
+        emit("summary", pmid=pmid, summary=summary)
+
+    return await summarize_search(abstracts, language, on_summary)
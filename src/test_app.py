@@ -187,6 +187,20 @@ class TestApp(unittest.TestCase):
             response = self.client().post(f'/api/users/{self.id}/results-abst-summary', data=json.dumps(data),\
                                           content_type='application/json')
             self.assertEqual(response.status_code, 200)
+
+    def test_stream_result_abst_summary(self):
+        # create data
+        data = {
+            "search_words": self.new_search_words,
+            "language": self.new_language_abst_summary
+        }
+        with self.app.app_context():
+            # check status code and the last event
+            response = self.client().post(f'/api/users/{self.id}/results-abst-summary/stream',
+                                          data=json.dumps(data), content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+            self.assertEqual(events[-1]["event"], "result_abst_summary")
         
     def test_get_user_results_abst_summary(self):
         with self.app.app_context():
@@ -251,5 +265,12 @@ class TestApp(unittest.TestCase):
             response = self.client().delete(f'/api/results-abst-summary/1')
             self.assertEqual(response.status_code, 200)
 
+    def test_get_metrics(self):
+        with self.app.app_context():
+            # check status code
+            response = self.client().get(f'/api/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("counters", response.get_json()["metrics"])
+
 if __name__ == "__main__":
     unittest.main()
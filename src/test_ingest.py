@@ -0,0 +1,110 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from ingest_pubmed import get_file_number, iter_catalog_rows
+
+SAMPLE_BASELINE = b"""<?xml version="1.0" ?>
+<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2024//EN" "https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_240101.dtd">
+<PubmedArticleSet>
+<PubmedArticle>
+    <MedlineCitation Status="MEDLINE" Owner="NLM">
+        <PMID Version="1">32293474</PMID>
+        <Article PubModel="Print">
+            <Journal>
+                <JournalIssue CitedMedium="Internet">
+                    <PubDate><Year>2020</Year><Month>Apr</Month><Day>15</Day></PubDate>
+                </JournalIssue>
+                <Title>Lab on a chip</Title>
+            </Journal>
+            <ArticleTitle>Neutrophil chemotaxis on a chip.</ArticleTitle>
+            <Abstract>
+                <AbstractText Label="BACKGROUND">Neutrophil chemotaxis plays a vital role.</AbstractText>
+                <AbstractText Label="RESULTS">Microfluidics provides a new platform.</AbstractText>
+            </Abstract>
+            <AuthorList CompleteYN="Y">
+                <Author ValidYN="Y"><LastName>Yang</LastName><Initials>K</Initials></Author>
+                <Author ValidYN="Y"><LastName>Lin</LastName><Initials>F</Initials></Author>
+            </AuthorList>
+        </Article>
+    </MedlineCitation>
+</PubmedArticle>
+<PubmedArticle>
+    <MedlineCitation Status="MEDLINE" Owner="NLM">
+        <PMID Version="1">12345678</PMID>
+        <Article PubModel="Print">
+            <Journal>
+                <JournalIssue CitedMedium="Print">
+                    <PubDate><Year>1999</Year></PubDate>
+                </JournalIssue>
+                <Title>Nature</Title>
+            </Journal>
+            <ArticleTitle>Article without abstract.</ArticleTitle>
+        </Article>
+    </MedlineCitation>
+</PubmedArticle>
+</PubmedArticleSet>
+"""
+
+SAMPLE_UPDATE = b"""<?xml version="1.0" ?>
+<PubmedArticleSet>
+<DeleteCitation>
+    <PMID Version="1">12345678</PMID>
+</DeleteCitation>
+</PubmedArticleSet>
+"""
+
+
+# ----------------------------------------------------------------------------#
+# Test Class
+# ----------------------------------------------------------------------------#
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        # Executed before each test
+        self.directory = tempfile.TemporaryDirectory()
+        self.baseline_path = os.path.join(self.directory.name, "pubmed24n0001.xml.gz")
+        with gzip.open(self.baseline_path, "wb") as f:
+            f.write(SAMPLE_BASELINE)
+        self.update_path = os.path.join(self.directory.name, "pubmed24n1220.xml.gz")
+        with gzip.open(self.update_path, "wb") as f:
+            f.write(SAMPLE_UPDATE)
+
+    def tearDown(self):
+        # Executed after each test
+        self.directory.cleanup()
+
+    def test_get_file_number(self):
+        self.assertEqual(get_file_number(self.baseline_path), 1)
+        self.assertEqual(get_file_number(self.update_path), 1220)
+        with self.assertRaises(ValueError):
+            get_file_number("abstracts.xml.gz")
+
+    def test_iter_catalog_rows_from_baseline(self):
+        rows = list(iter_catalog_rows(self.baseline_path))
+        self.assertEqual(len(rows), 2)
+
+        pmid, title, last_author, publication_date, abstract, deleted, \
+            file_number = rows[0]
+        self.assertEqual(pmid, "32293474")
+        self.assertEqual(title, "Neutrophil chemotaxis on a chip.")
+        self.assertEqual(last_author, "Lin F")
+        self.assertEqual(publication_date, "2020 Apr 15")
+        self.assertEqual(abstract, "BACKGROUND: Neutrophil chemotaxis plays a vital role.\n"
+                                   "RESULTS: Microfluidics provides a new platform.")
+        self.assertFalse(deleted)
+        self.assertEqual(file_number, 1)
+
+        # article without abstract or authors
+        self.assertEqual(rows[1][0], "12345678")
+        self.assertEqual(rows[1][3], "1999")
+        self.assertIsNone(rows[1][2])
+        self.assertIsNone(rows[1][4])
+
+    def test_iter_catalog_rows_from_update(self):
+        rows = list(iter_catalog_rows(self.update_path))
+        self.assertEqual(rows, [("12345678", None, None, None, None, True, 1220)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+import json
+import os
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from app import create_app
+
+import jobs
+from jobs import (Heartbeat, PermanentJobError, enqueue, dequeue, complete,
+                  fail, run_job)
+from models import Job, User, db
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_PATH = f'postgresql://{os.environ["DATABASE_USER"]}' + \
+                f':{os.environ["DATABASE_PASSWORD"]}' + \
+                f'@{os.environ["DATABASE_ENDPOINT"]}:5432' + \
+                f'/{os.environ["TEST_DATABASE_NAME"]}'
+
+JOB_TYPE = "abst_translation"
+PAYLOAD = {"paper_id": 1, "language": "Japanese"}
+
+
+# ----------------------------------------------------------------------------#
+# Test Class
+# ----------------------------------------------------------------------------#
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        # Executed before each test
+        self.database_path = DATABASE_PATH
+        self.app = create_app(self.database_path)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.drop_all()
+        db.create_all()
+
+    def tearDown(self):
+        # Executed after each test
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def run_handler(self, job, handler, worker_id="worker-1"):
+        # run job with handler in place of the real one
+        with mock.patch.dict(jobs.JOB_HANDLERS, {JOB_TYPE: handler}):
+            run_job(job, worker_id)
+        db.session.refresh(job)
+
+    def test_enqueue(self):
+        job = enqueue(JOB_TYPE, PAYLOAD, max_attempts=2)
+
+        query = db.session.get(Job, job.id)
+        self.assertEqual(query.status, "queued")
+        self.assertEqual(json.loads(query.payload), PAYLOAD)
+        self.assertEqual(query.attempts, 0)
+        self.assertEqual(query.max_attempts, 2)
+        with self.assertRaises(ValueError):
+            enqueue("unknown", PAYLOAD)
+
+    def test_dequeue_in_order(self):
+        first = enqueue(JOB_TYPE, PAYLOAD)
+        second = enqueue(JOB_TYPE, PAYLOAD)
+
+        job = dequeue(JOB_TYPE, "worker-1")
+        self.assertEqual(job.id, first.id)
+        self.assertEqual(job.status, "running")
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(job.locked_by, "worker-1")
+        self.assertGreater(job.locked_until, datetime.now())
+        self.assertEqual(dequeue(JOB_TYPE, "worker-2").id, second.id)
+        self.assertIsNone(dequeue(JOB_TYPE, "worker-3"))
+
+    def test_dequeue_by_job_type(self):
+        enqueue(JOB_TYPE, PAYLOAD)
+        self.assertIsNone(dequeue("abst_summary", "worker-1"))
+
+    def test_dequeue_takes_over_expired_lock(self):
+        enqueue(JOB_TYPE, PAYLOAD)
+        job = dequeue(JOB_TYPE, "worker-1", visibility_timeout=-1)
+
+        taken = dequeue(JOB_TYPE, "worker-2")
+        self.assertEqual(taken.id, job.id)
+        self.assertEqual(taken.locked_by, "worker-2")
+        self.assertEqual(taken.attempts, 2)
+
+    def test_complete(self):
+        enqueue(JOB_TYPE, PAYLOAD)
+        job = dequeue(JOB_TYPE, "worker-1")
+        self.run_handler(job, lambda payload: {"language": payload["language"]})
+
+        self.assertEqual(job.status, "done")
+        self.assertEqual(json.loads(job.result), {"language": "Japanese"})
+        self.assertIsNone(job.locked_until)
+
+    def test_failed_job_is_retried_later(self):
+        enqueue(JOB_TYPE, PAYLOAD)
+        job = dequeue(JOB_TYPE, "worker-1")
+        failed_at = datetime.now()
+
+        def handler(payload):
+            raise RuntimeError("DeepL is down")
+
+        self.run_handler(job, handler)
+        self.assertEqual(job.status, "queued")
+        self.assertIn("DeepL is down", job.error)
+        self.assertIsNone(job.locked_until)
+        self.assertGreaterEqual(job.run_at, failed_at)
+
+    def test_failed_job_gives_up_after_max_attempts(self):
+        enqueue(JOB_TYPE, PAYLOAD, max_attempts=1)
+        job = dequeue(JOB_TYPE, "worker-1")
+
+        def handler(payload):
+            raise RuntimeError("DeepL is down")
+
+        self.run_handler(job, handler)
+        self.assertEqual(job.status, "failed")
+
+    def test_permanent_error_is_not_retried(self):
+        enqueue(JOB_TYPE, PAYLOAD)
+        job = dequeue(JOB_TYPE, "worker-1")
+
+        def handler(payload):
+            raise PermanentJobError("Paper not found")
+
+        self.run_handler(job, handler)
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.attempts, 1)
+
+    def test_timed_out_last_attempt_fails(self):
+        enqueue(JOB_TYPE, PAYLOAD, max_attempts=1)
+        dequeue(JOB_TYPE, "worker-1", visibility_timeout=-1)
+        job = dequeue(JOB_TYPE, "worker-2")
+        self.run_handler(job, lambda payload: {}, "worker-2")
+
+        self.assertEqual(job.status, "failed")
+        self.assertIn("timed out", job.error)
+
+    def test_worker_that_lost_the_lock_does_not_update(self):
+        enqueue(JOB_TYPE, PAYLOAD)
+        job = dequeue(JOB_TYPE, "worker-1", visibility_timeout=-1)
+        dequeue(JOB_TYPE, "worker-2")
+
+        complete(job, {"late": True}, "worker-1")
+        fail(job, RuntimeError("late"), "worker-1")
+        db.session.refresh(job)
+        self.assertEqual(job.status, "running")
+        self.assertEqual(job.locked_by, "worker-2")
+        self.assertIsNone(job.result)
+
+    def test_result_of_a_taken_over_job_is_not_written(self):
+        enqueue(JOB_TYPE, PAYLOAD)
+        job = dequeue(JOB_TYPE, "worker-1")
+
+        def handler(payload):
+            # another worker takes the job over while this one runs
+            with db.engine.begin() as connection:
+                connection.execute(db.update(Job).where(Job.id == job.id)
+                                   .values(locked_by="worker-2"))
+            db.session.add(User(id="tarogithub", name="Taro", email="0000000@gmail.com"))
+            db.session.flush()
+            return {}
+
+        self.run_handler(job, handler)
+        self.assertEqual(job.status, "running")
+        self.assertEqual(job.locked_by, "worker-2")
+        self.assertIsNone(db.session.get(User, "tarogithub"))
+
+    def test_heartbeat_extends_the_lock(self):
+        enqueue(JOB_TYPE, PAYLOAD)
+        job = dequeue(JOB_TYPE, "worker-1", visibility_timeout=1)
+        locked_until = job.locked_until
+
+        with Heartbeat(db.engine, job.id, "worker-1", interval=0.05,
+                       visibility_timeout=60) as heartbeat:
+            time.sleep(0.2)
+        db.session.refresh(job)
+        self.assertGreater(job.locked_until, locked_until)
+        self.assertFalse(heartbeat.lost)
+
+    def test_heartbeat_notices_a_lost_lock(self):
+        enqueue(JOB_TYPE, PAYLOAD)
+        job = dequeue(JOB_TYPE, "worker-1")
+
+        heartbeat = Heartbeat(db.engine, job.id, "worker-2")
+        self.assertFalse(heartbeat.renew())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,19 @@
+import asyncio
+from datetime import datetime, timedelta
 import os
 import unittest
 
 from flask_sqlalchemy import SQLAlchemy
 
 from app import create_app
+from lib.llm_cache import LLMResponseCache
+from lib.record_cache import PubmedRecordCache
+from lib.summary_store import PaperSummaryStore
 
 from models import (User, Paper, PaperTag, ResultAbstTranslation,
-                    ResultAbstSummary, ResultPaperSummary, db, setup_db)
+                    ResultAbstSummary, ResultPaperSummary, PubmedRecord,
+                    LLMResponse, PaperSummary,
+                    db, setup_db)
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -115,6 +122,14 @@ def set_variables(self):
     self.new_length = "long"
     self.new_language_paper_summary = "English"
 
+    # pubmed record attributes
+    self.new_record_kind = "abstract"
+    self.new_llm_key = "0" * 64
+    self.new_llm_module_name = "abst_sum"
+    self.new_llm_response = '{"summary": "New Summary"}'
+    self.new_prompt_version = "0123456789ab"
+    self.new_ai_model_id = "gpt-3.5-turbo"
+
 
 # ----------------------------------------------------------------------------#
 # Test Class
@@ -271,6 +286,122 @@ class TestModel(unittest.TestCase):
             self.assertEqual(query.length, self.new_length)
             self.assertEqual(query.language, self.new_language_paper_summary)
             self.assertIsNotNone(query.created_at)
+
+    def test_pubmed_records_are_upserted(self):
+        with self.app.app_context():
+            # store a record twice, then a negative one
+            asyncio.run(PubmedRecordCache().set_many(
+                self.new_record_kind, {self.new_pmid: self.abstract}))
+            asyncio.run(PubmedRecordCache().set_many(
+                self.new_record_kind, {self.new_pmid: self.new_abstract, self.pmid: None}))
+
+            # a new cache (empty memory level) reads them from the table
+            entries = asyncio.run(PubmedRecordCache().get_many(
+                self.new_record_kind, [self.new_pmid, self.pmid]))
+            self.assertEqual(entries[self.new_pmid].value, self.new_abstract)
+            self.assertIsNone(entries[self.pmid].value)
+            query = db.select(PubmedRecord).where(PubmedRecord.pmid == self.new_pmid)
+            self.assertEqual(len(db.session.scalars(query).all()), 1)
+
+    def test_expired_pubmed_records(self):
+        with self.app.app_context():
+            # a record older than the stale ttl
+            PubmedRecord(
+                pmid=self.new_pmid,
+                kind=self.new_record_kind,
+                payload=f'"{self.new_abstract}"',
+                fetched_at=datetime.now() - timedelta(days=365)
+            ).insert()
+
+            cache = PubmedRecordCache()
+            entries = asyncio.run(cache.get_many(self.new_record_kind, [self.new_pmid]))
+            self.assertEqual(entries, {})
+            values = asyncio.run(cache.get_expired(self.new_record_kind, [self.new_pmid]))
+            self.assertEqual(values, {self.new_pmid: self.new_abstract})
+
+    def test_pubmed_record_cache_keeps_the_session(self):
+        # the cache writes with a session of its own
+        new_user = User(
+            id=self.new_id,
+            name=self.new_name,
+            email=self.new_email
+        )
+        with self.app.app_context():
+            db.session.add(new_user)
+            asyncio.run(PubmedRecordCache().set_many(
+                self.new_record_kind, {self.new_pmid: self.new_abstract}))
+            db.session.rollback()
+
+            self.assertIsNone(db.session.get(User, self.new_id))
+            query = db.select(PubmedRecord).where(PubmedRecord.pmid == self.new_pmid)
+            self.assertIsNotNone(db.session.scalars(query).first())
+
+    def test_llm_responses_are_upserted(self):
+        with self.app.app_context():
+            asyncio.run(LLMResponseCache().set(
+                self.new_llm_key, self.new_llm_module_name, '{"summary": "Summary"}'))
+            asyncio.run(LLMResponseCache().set(
+                self.new_llm_key, self.new_llm_module_name, self.new_llm_response))
+
+            # a new cache (empty memory level) reads it from the table
+            response = asyncio.run(LLMResponseCache().get(self.new_llm_key))
+            self.assertEqual(response, self.new_llm_response)
+            query = db.select(LLMResponse).where(LLMResponse.key == self.new_llm_key)
+            self.assertEqual(len(db.session.scalars(query).all()), 1)
+
+    def test_expired_llm_responses_are_purged(self):
+        with self.app.app_context():
+            LLMResponse(
+                key=self.new_llm_key,
+                module_name=self.new_llm_module_name,
+                response=self.new_llm_response,
+                created_at=datetime.now() - timedelta(days=365)
+            ).insert()
+
+            cache = LLMResponseCache(purge_interval=0)
+            self.assertIsNone(asyncio.run(cache.get(self.new_llm_key)))
+            # storing another response purges the expired one
+            asyncio.run(cache.set("1" * 64, self.new_llm_module_name, self.new_llm_response))
+            self.assertEqual(db.session.scalars(db.select(LLMResponse.key)).all(), ["1" * 64])
+
+    def test_paper_summaries_are_reused(self):
+        store = PaperSummaryStore(self.new_prompt_version, self.new_ai_model_id)
+        language = self.new_language_abst_summary
+        with self.app.app_context():
+            asyncio.run(store.set_many({self.new_pmid: self.new_abst_summary}, language))
+            # a pmid already stored keeps its summary
+            asyncio.run(store.set_many({self.new_pmid: self.abst_summary,
+                                        self.pmid: self.abst_summary}, language))
+
+            summaries = asyncio.run(store.get_many([self.new_pmid, self.pmid], language))
+            self.assertEqual(summaries, {self.new_pmid: self.new_abst_summary,
+                                         self.pmid: self.abst_summary})
+            # other prompts, models or languages do not share them
+            other_prompt = PaperSummaryStore("ba9876543210", self.new_ai_model_id)
+            other_model = PaperSummaryStore(self.new_prompt_version, "gpt-4o")
+            for other_store in (other_prompt, other_model):
+                self.assertEqual(asyncio.run(other_store.get_many([self.new_pmid], language)), {})
+            self.assertEqual(asyncio.run(store.get_many([self.new_pmid], "Japanese")), {})
+
+    def test_result_abst_summary_links_paper_summaries(self):
+        store = PaperSummaryStore(self.new_prompt_version, self.new_ai_model_id)
+        language = self.new_language_abst_summary
+        new_result_abst_summary = ResultAbstSummary(
+            abst_summary=self.new_abst_summary,
+            language=language
+        )
+        with self.app.app_context():
+            asyncio.run(store.set_many({self.new_pmid: self.new_abst_summary,
+                                        self.pmid: self.abst_summary}, language))
+            new_result_abst_summary.paper_summaries = store.rows([self.new_pmid], language)
+            new_result_abst_summary.user = db.session.get(User, self.id)
+            new_result_abst_summary.insert()
+
+            result = db.session.get(ResultAbstSummary, new_result_abst_summary.id)
+            self.assertEqual(result.format()['pmids'], [self.new_pmid])
+            # the stored summary outlives the result
+            result.delete()
+            self.assertEqual(len(db.session.scalars(db.select(PaperSummary)).all()), 2)
     
 
 
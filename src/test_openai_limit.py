@@ -0,0 +1,154 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from lib.openai_limit import (OpenAILimiter, call_with_limits, error_response,
+                              parse_reset, retry_delay)
+
+
+class HTTPError(Exception):
+    # like the openai errors: status_code and the response with its headers
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = mock.Mock(headers=headers or {})
+
+
+def has_tokens(limiter, tokens):
+    # True when tokens are available right now (they are taken)
+    return limiter.tokens.try_acquire(tokens)
+
+
+# ----------------------------------------------------------------------------#
+# Test Class
+# ----------------------------------------------------------------------------#
+class TestRetryDelay(unittest.TestCase):
+    def test_parse_reset(self):
+        self.assertEqual(parse_reset("1s"), 1)
+        self.assertEqual(parse_reset("6m0s"), 360)
+        self.assertAlmostEqual(parse_reset("20ms"), 0.02)
+        self.assertAlmostEqual(parse_reset("1h2m3.5s"), 3723.5)
+        self.assertIsNone(parse_reset(""))
+        self.assertIsNone(parse_reset("soon"))
+
+    def test_retry_after_ms_wins(self):
+        delay = retry_delay({"retry-after-ms": "1500", "retry-after": "10"}, 0)
+        self.assertGreaterEqual(delay, 1.5)
+        self.assertLessEqual(delay, 1.75)
+
+    def test_retry_after(self):
+        delay = retry_delay({"retry-after": "10"}, 0)
+        self.assertGreaterEqual(delay, 10)
+        self.assertLessEqual(delay, 10.25)
+
+    def test_reset_of_exhausted_limit(self):
+        delay = retry_delay({
+            "x-ratelimit-remaining-requests": "5",
+            "x-ratelimit-reset-requests": "30s",
+            "x-ratelimit-remaining-tokens": "0",
+            "x-ratelimit-reset-tokens": "2s",
+        }, 0)
+        self.assertGreaterEqual(delay, 2)
+        self.assertLessEqual(delay, 2.25)
+
+    def test_delay_is_capped(self):
+        with mock.patch("lib.openai_limit.OPENAI_MAX_RETRY_DELAY", 5):
+            delay = retry_delay({"retry-after": "3600"}, 0)
+        self.assertLessEqual(delay, 5.25)
+
+    def test_backoff_without_headers(self):
+        delay = retry_delay({}, 2)
+        self.assertGreaterEqual(delay, 0)
+        self.assertLessEqual(delay, 2)
+
+    def test_error_response_follows_the_cause(self):
+        try:
+            try:
+                raise HTTPError(429, {"retry-after": "1"})
+            except HTTPError as e:
+                raise RuntimeError("service error") from e
+        except RuntimeError as e:
+            status, headers = error_response(e)
+        self.assertEqual(status, 429)
+        self.assertEqual(headers, {"retry-after": "1"})
+        self.assertEqual(error_response(ValueError()), (None, {}))
+
+
+class TestCallWithLimits(unittest.TestCase):
+    def setUp(self):
+        # Executed before each test
+        # 10 tokens per second, 100 usable at once, state in this process
+        self.limiter = OpenAILimiter(rpm=600, tpm=600, burst=10, state_dir=None)
+        self.attempts = 0
+        # retry at once
+        self.retry_delay = mock.patch("lib.openai_limit.retry_delay", return_value=0)
+        self.retry_delay.start()
+
+    def tearDown(self):
+        # Executed after each test
+        self.retry_delay.stop()
+
+    def call(self, *errors, timeout=1.0):
+        # each attempt raises the next error ("timeout" hangs); the attempt
+        # after them succeeds
+        async def factory():
+            self.attempts += 1
+            if self.attempts > len(errors):
+                return "response"
+            error = errors[self.attempts - 1]
+            if error == "timeout":
+                await asyncio.sleep(1)
+            else:
+                raise error
+
+        return asyncio.run(call_with_limits(factory, 50, timeout=timeout,
+                                            limiter=self.limiter, max_retries=2))
+
+    def test_success_keeps_the_tokens(self):
+        self.assertEqual(self.call(), "response")
+        self.assertFalse(has_tokens(self.limiter, 60))
+
+    def test_retries_5xx(self):
+        self.assertEqual(self.call(HTTPError(500), HTTPError(503)), "response")
+        self.assertEqual(self.attempts, 3)
+        # only the successful attempt holds tokens
+        self.assertFalse(has_tokens(self.limiter, 60))
+        self.assertTrue(has_tokens(self.limiter, 45))
+
+    def test_429_pauses_the_limiter(self):
+        with mock.patch.object(self.limiter, "pause") as pause:
+            self.assertEqual(self.call(HTTPError(429)), "response")
+        pause.assert_called_once_with(0)
+
+    def test_gives_up_after_max_retries(self):
+        with self.assertRaises(HTTPError):
+            self.call(HTTPError(500), HTTPError(500), HTTPError(500))
+        self.assertEqual(self.attempts, 3)
+        self.assertTrue(has_tokens(self.limiter, 95))
+
+    def test_other_errors_are_not_retried(self):
+        with self.assertRaises(HTTPError):
+            self.call(HTTPError(400))
+        self.assertEqual(self.attempts, 1)
+        self.assertTrue(has_tokens(self.limiter, 95))
+
+    def test_cancelled_while_queued_gives_the_reservation_back(self):
+        async def run():
+            # the first call uses up the budget, the second one queues
+            await self.limiter.acquire(100)
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(self.limiter.acquire(100), 0.1)
+
+        asyncio.run(run())
+        # only the first reservation is left: about 1 token back after 0.1 sec
+        self.assertTrue(has_tokens(self.limiter, 1))
+        self.assertTrue(self.limiter.requests.try_acquire(1))
+
+    def test_timeout_gives_the_tokens_back(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            self.call("timeout", timeout=0.01)
+        self.assertTrue(has_tokens(self.limiter, 95))
+
+
+if __name__ == "__main__":
+    unittest.main()
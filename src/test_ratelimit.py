@@ -0,0 +1,78 @@
+from email.utils import formatdate
+import os
+import tempfile
+import time
+import unittest
+
+from lib.ratelimit import TokenBucket, parse_retry_after, backoff_delay
+
+
+# ----------------------------------------------------------------------------#
+# Test Class
+# ----------------------------------------------------------------------------#
+class TestTokenBucket(unittest.TestCase):
+    def setUp(self):
+        # Executed before each test
+        # 1 token per second, burst of 2 tokens
+        self.bucket = TokenBucket("test", rate=1, capacity=2)
+
+    def test_reserve_within_capacity(self):
+        self.assertEqual(self.bucket.reserve(), 0)
+        self.assertEqual(self.bucket.reserve(), 0)
+
+    def test_reserve_goes_into_debt(self):
+        self.bucket.reserve(2)
+        self.assertAlmostEqual(self.bucket.reserve(), 1, delta=0.1)
+        # later callers wait behind earlier reservations
+        self.assertAlmostEqual(self.bucket.reserve(), 2, delta=0.1)
+
+    def test_release_gives_tokens_back(self):
+        self.bucket.reserve(3)
+        self.bucket.release(2)
+        self.assertEqual(self.bucket.reserve(), 0)
+
+    def test_release_is_capped_at_capacity(self):
+        self.bucket.release(10)
+        self.bucket.reserve(2)
+        self.assertAlmostEqual(self.bucket.reserve(), 1, delta=0.1)
+
+    def test_hold(self):
+        self.bucket.hold(5)
+        self.assertAlmostEqual(self.bucket.reserve(), 6, delta=0.1)
+
+    def test_try_acquire(self):
+        self.assertTrue(self.bucket.try_acquire(2))
+        self.assertFalse(self.bucket.try_acquire())
+
+    def test_state_file_is_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            state_path = os.path.join(directory, "rate_limit.json")
+            first = TokenBucket("first", rate=1, capacity=2, state_path=state_path)
+            second = TokenBucket("second", rate=1, capacity=2, state_path=state_path)
+            first.reserve(2)
+            self.assertFalse(second.try_acquire())
+            self.assertAlmostEqual(second.reserve(), 1, delta=0.1)
+
+
+class TestRetryAfter(unittest.TestCase):
+    def test_parse_retry_after_seconds(self):
+        self.assertEqual(parse_retry_after("3"), 3)
+        self.assertEqual(parse_retry_after("-1"), 0)
+
+    def test_parse_retry_after_date(self):
+        value = formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(value), 30, delta=2)
+
+    def test_parse_retry_after_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+    def test_backoff_delay_is_capped(self):
+        for attempt in range(10):
+            delay = backoff_delay(attempt, base=0.5, cap=4)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(4, 0.5 * 2 ** attempt))
+
+
+if __name__ == "__main__":
+    unittest.main()
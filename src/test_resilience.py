@@ -0,0 +1,133 @@
+import asyncio
+import time
+import unittest
+
+from lib.resilience import (CircuitBreaker, LatencyTracker, hedged,
+                            CLOSED, OPEN, HALF_OPEN)
+
+
+def fail_calls(breaker, count):
+    for _ in range(count):
+        breaker.record_failure()
+
+
+# ----------------------------------------------------------------------------#
+# Test Class
+# ----------------------------------------------------------------------------#
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        # Executed before each test
+        self.breaker = CircuitBreaker("test", error_rate=0.5, window=30,
+                                      min_calls=4, reset_timeout=0.05)
+
+    def test_stays_closed_below_min_calls(self):
+        fail_calls(self.breaker, 3)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_stays_closed_below_error_rate(self):
+        for _ in range(3):
+            self.breaker.record_success()
+        fail_calls(self.breaker, 2)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_opens_at_error_rate(self):
+        self.breaker.record_success()
+        fail_calls(self.breaker, 3)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_lets_one_probe_through(self):
+        fail_calls(self.breaker, 4)
+        time.sleep(0.06)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_successful_probe_closes(self):
+        fail_calls(self.breaker, 4)
+        time.sleep(0.06)
+        self.breaker.allow()
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        # the failures before the probe are forgotten
+        self.assertEqual(self.breaker.snapshot()["calls"], 1)
+
+    def test_failed_probe_reopens(self):
+        fail_calls(self.breaker, 4)
+        time.sleep(0.06)
+        self.breaker.allow()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_lost_probe_is_replaced(self):
+        fail_calls(self.breaker, 4)
+        time.sleep(0.06)
+        self.assertTrue(self.breaker.allow())
+        # the probe never reports back
+        time.sleep(0.06)
+        self.assertTrue(self.breaker.allow())
+
+
+class TestLatencyTracker(unittest.TestCase):
+    def test_percentile(self):
+        tracker = LatencyTracker(size=100, min_samples=10)
+        for i in range(9):
+            tracker.add(i)
+        self.assertIsNone(tracker.percentile(95))
+        tracker.add(9)
+        self.assertEqual(tracker.percentile(50), 5)
+        self.assertEqual(tracker.percentile(100), 9)
+
+
+class TestHedged(unittest.TestCase):
+    def run_hedged(self, delays, hedge_delay, can_hedge=True):
+        # each call of the factory takes the next delay; a negative one fails
+        calls = []
+
+        async def factory():
+            number = len(calls)
+            calls.append(number)
+            delay = delays[number]
+            await asyncio.sleep(abs(delay))
+            if delay < 0:
+                raise ValueError(number)
+            return number
+
+        result = asyncio.run(hedged(factory, hedge_delay, lambda: can_hedge))
+        return result, calls
+
+    def test_fast_call_is_not_hedged(self):
+        result, calls = self.run_hedged([0.01], 0.1)
+        self.assertEqual(result, 0)
+        self.assertEqual(calls, [0])
+
+    def test_no_delay_does_not_hedge(self):
+        result, calls = self.run_hedged([0.1], None)
+        self.assertEqual(result, 0)
+        self.assertEqual(calls, [0])
+
+    def test_slow_call_is_hedged(self):
+        result, calls = self.run_hedged([0.5, 0.01], 0.05)
+        self.assertEqual(result, 1)
+        self.assertEqual(calls, [0, 1])
+
+    def test_hedge_needs_budget(self):
+        result, calls = self.run_hedged([0.1, 0.01], 0.01, can_hedge=False)
+        self.assertEqual(result, 0)
+        self.assertEqual(calls, [0])
+
+    def test_failed_copy_waits_for_the_other(self):
+        result, _ = self.run_hedged([0.2, -0.01], 0.05)
+        self.assertEqual(result, 0)
+
+    def test_every_copy_failed(self):
+        with self.assertRaises(ValueError) as context:
+            self.run_hedged([-0.1, -0.01], 0.05)
+        # the exception of the first copy
+        self.assertEqual(context.exception.args, (0,))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from app import create_app
+from lib import singleflight
+from lib.singleflight import SingleFlight, advisory_lock, advisory_lock_id
+
+
+# ----------------------------------------------------------------------------#
+# Test Class
+# ----------------------------------------------------------------------------#
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        # Executed before each test
+        self.flight = SingleFlight("test")
+        self.calls = 0
+
+    async def fetch(self):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return {"pmids": ["1", "2"]}
+
+    async def fail(self):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        raise ValueError("PubMed is down")
+
+    def test_concurrent_calls_are_shared(self):
+        async def run():
+            return await asyncio.gather(*[self.flight.do("key", self.fetch) for _ in range(3)])
+
+        results = asyncio.run(run())
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{"pmids": ["1", "2"]}] * 3)
+
+    def test_different_keys_are_not_shared(self):
+        async def run():
+            await asyncio.gather(self.flight.do("a", self.fetch), self.flight.do("b", self.fetch))
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, 2)
+
+    def test_finished_calls_are_not_reused(self):
+        async def run():
+            await self.flight.do("key", self.fetch)
+            await self.flight.do("key", self.fetch)
+
+        asyncio.run(run())
+        self.assertEqual(self.calls, 2)
+
+    def test_callers_get_copies(self):
+        async def run():
+            return await asyncio.gather(self.flight.do("key", self.fetch),
+                                        self.flight.do("key", self.fetch))
+
+        first, second = asyncio.run(run())
+        first["pmids"].append("3")
+        self.assertEqual(second, {"pmids": ["1", "2"]})
+
+    def test_exception_is_shared(self):
+        async def run():
+            return await asyncio.gather(self.flight.do("key", self.fail),
+                                        self.flight.do("key", self.fail),
+                                        return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertEqual(self.calls, 1)
+        for result in results:
+            self.assertIsInstance(result, ValueError)
+
+    def test_cancelled_caller_does_not_cancel_others(self):
+        async def run():
+            first = asyncio.ensure_future(self.flight.do("key", self.fetch))
+            second = asyncio.ensure_future(self.flight.do("key", self.fetch))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), {"pmids": ["1", "2"]})
+        self.assertEqual(self.calls, 1)
+
+
+class TestAdvisoryLock(unittest.TestCase):
+    def test_advisory_lock_id(self):
+        lock_id = advisory_lock_id("pubmed:summary:1,2")
+        self.assertEqual(lock_id, advisory_lock_id("pubmed:summary:1,2"))
+        self.assertNotEqual(lock_id, advisory_lock_id("pubmed:summary:1,3"))
+        self.assertTrue(-2 ** 63 <= lock_id < 2 ** 63)
+
+    def test_advisory_lock_without_app_context(self):
+        async def run():
+            async with advisory_lock("key"):
+                return True
+
+        self.assertTrue(asyncio.run(run()))
+
+    def test_cancelled_waiter_releases_the_lock(self):
+        # the blocking lock call is only answered after the caller is cancelled
+        locked = threading.Event()
+        events = []
+
+        def lock(engine, lock_id):
+            locked.wait()
+            events.append("locked")
+            return "connection"
+
+        def unlock(connection, lock_id):
+            events.append("unlocked")
+
+        async def run():
+            waiter = asyncio.ensure_future(advisory_lock("key").__aenter__())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            locked.set()
+            await asyncio.sleep(0.1)
+
+        app = create_app("sqlite://")
+        with app.app_context(), \
+                mock.patch.object(singleflight, "PUBMED_COALESCE_ACROSS_WORKERS", True), \
+                mock.patch.object(singleflight, "_lock", lock), \
+                mock.patch.object(singleflight, "_unlock", unlock):
+            asyncio.run(run())
+        self.assertEqual(events, ["locked", "unlocked"])
+
+
+if __name__ == "__main__":
+    unittest.main()
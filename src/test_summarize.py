@@ -0,0 +1,130 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from lib.tokens import count_tokens
+from skills import OPENAI_MODEL_ID
+from summarize import pack_abstracts, group_summaries, reduce_summaries
+
+ABSTRACT = "Neutrophil chemotaxis plays a vital role in the human immune system."
+
+
+def tokens(text):
+    return count_tokens(text, OPENAI_MODEL_ID)
+
+
+# ----------------------------------------------------------------------------#
+# Test Class
+# ----------------------------------------------------------------------------#
+class TestPackAbstracts(unittest.TestCase):
+    def setUp(self):
+        # Executed before each test
+        self.abstracts = {str(pmid): ABSTRACT for pmid in range(1, 6)}
+
+    def test_pack_by_size(self):
+        packs = pack_abstracts(self.abstracts, max_tokens=10000, max_size=2)
+        self.assertEqual(packs, [["1", "2"], ["3", "4"], ["5"]])
+
+    def test_pack_by_tokens(self):
+        packs = pack_abstracts(self.abstracts, max_tokens=3 * tokens(ABSTRACT), max_size=10)
+        self.assertEqual(packs, [["1", "2", "3"], ["4", "5"]])
+
+    def test_long_abstract_gets_its_own_pack(self):
+        self.abstracts["2"] = ABSTRACT * 10
+        packs = pack_abstracts(self.abstracts, max_tokens=3 * tokens(ABSTRACT), max_size=10)
+        self.assertEqual(packs, [["1"], ["2"], ["3", "4", "5"]])
+
+    def test_pack_keeps_order(self):
+        packs = pack_abstracts(self.abstracts, max_tokens=10000, max_size=10)
+        self.assertEqual(packs, [["1", "2", "3", "4", "5"]])
+
+    def test_pack_nothing(self):
+        self.assertEqual(pack_abstracts({}), [])
+
+
+class TestReduceSummaries(unittest.TestCase):
+    def setUp(self):
+        # Executed before each test
+        self.summaries = [f"Summary {i}. {ABSTRACT}" for i in range(5)]
+        # room for two summaries per group
+        self.max_tokens = 2 * max(tokens(summary) for summary in self.summaries)
+        self.calls = []
+
+    async def combine(self, summaries, language="English"):
+        # combined summaries are as long as one summary
+        self.calls.append(len(summaries))
+        return f"Summary {len(self.calls)}. {ABSTRACT}"
+
+    def reduce(self, combine, **kwargs):
+        with mock.patch("summarize.combine_summaries", combine):
+            return asyncio.run(reduce_summaries(self.summaries, max_tokens=self.max_tokens,
+                                                **kwargs))
+
+    def test_group_summaries(self):
+        groups = group_summaries(self.summaries[:4], self.max_tokens)
+        self.assertEqual(groups, [self.summaries[:2], self.summaries[2:4]])
+
+    def test_group_over_budget_keeps_two_summaries(self):
+        groups = group_summaries(self.summaries[:3], max_tokens=1)
+        self.assertEqual(groups, [self.summaries[:2], self.summaries[2:3]])
+
+    def test_lone_summary_is_merged_when_it_fits(self):
+        max_tokens = sum(tokens(summary) for summary in self.summaries[:3])
+        groups = group_summaries(self.summaries[:3], max_tokens)
+        self.assertEqual(groups, [self.summaries[:3]])
+
+    def test_lone_summary_is_not_merged_over_budget(self):
+        groups = group_summaries(self.summaries, self.max_tokens)
+        self.assertEqual(groups, [self.summaries[:2], self.summaries[2:4],
+                                  self.summaries[4:]])
+
+    def test_reduce_level_by_level(self):
+        summary = self.reduce(self.combine)
+        # 5 -> 3 -> 2 -> 1, the lone summary waits for a later level
+        self.assertEqual(self.calls, [2, 2, 2, 2])
+        self.assertEqual(summary, f"Summary 4. {ABSTRACT}")
+
+    def test_reduce_one_summary(self):
+        self.summaries = self.summaries[:1]
+        self.reduce(self.combine)
+        self.assertEqual(self.calls, [1])
+
+    def test_reduce_carries_lone_summary_over(self):
+        self.summaries = self.summaries[:3]
+        summary = self.reduce(self.combine)
+        # [s0, s1], [s2] -> [S1, s2] -> S2
+        self.assertEqual(self.calls, [2, 2])
+        self.assertEqual(summary, f"Summary 2. {ABSTRACT}")
+
+    def test_reduce_carries_failed_groups_over(self):
+        failed = []
+
+        async def combine(summaries, language="English"):
+            if not failed:
+                failed.append(summaries)
+                raise RuntimeError("OpenAI is down")
+            return await self.combine(summaries, language)
+
+        self.reduce(combine)
+        self.assertEqual(len(failed), 1)
+
+    def test_reduce_fails_without_progress(self):
+        async def combine(summaries, language="English"):
+            if len(summaries) > 1:
+                raise RuntimeError("OpenAI is down")
+            return await self.combine(summaries, language)
+
+        with self.assertRaises(RuntimeError):
+            self.reduce(combine)
+
+    def test_reduce_fails_after_max_levels(self):
+        with self.assertRaises(RuntimeError):
+            self.reduce(self.combine, max_levels=2)
+
+    def test_reduce_nothing(self):
+        with self.assertRaises(ValueError):
+            asyncio.run(reduce_summaries([]))
+
+
+if __name__ == "__main__":
+    unittest.main()